@@ -0,0 +1,227 @@
+"""
+adaptive_batch.py
+Tamano de lote adaptativo para los INSERT de load_flight_data.
+- El primer lote se calcula con el ancho de fila codificado (muestra de filas ya convertidas) y el
+  max_allowed_packet del servidor: nunca se pide un lote que no quepa en un paquete.
+- Despues de cada lote se mide la latencia (executemany + commit) y el tamano se acerca a la latencia
+  objetivo: como mucho x2 o /2 por paso, con una banda muerta del 10% para no oscilar.
+- Cada decision se escribe en el log ([batch-size] ...).
+SimulatedEngine es un sustituto de la conexion que simula curvas de latencia (sin servidor) para
+probar el controlador: python adaptive_batch.py simulate --help
+"""
+
+import argparse
+import math
+import threading
+import time
+
+# max_allowed_packet por defecto de MySQL 5.7 (8.0 usa 64MB): si no se puede consultar, el mas prudente
+DEFAULT_MAX_ALLOWED_PACKET = 4 * 1024 * 1024
+
+
+def encoded_row_width(rows, sample=200):
+    """Bytes aproximados de una fila en el VALUES (...) del INSERT, con una muestra de filas convertidas."""
+    sample_rows = rows[:sample]
+    if not sample_rows:
+        return 1
+    total = 0
+    for row in sample_rows:
+        # literal + comillas/separador por valor, parentesis y coma por fila; NULL = 4
+        total += sum(4 if v is None else len(str(v)) + 3 for v in row) + 3
+    return max(1, math.ceil(total / len(sample_rows)))
+
+
+def server_max_allowed_packet(cursor, dialect_name):
+    """@@max_allowed_packet del servidor MySQL; DEFAULT_MAX_ALLOWED_PACKET con otros motores o si falla."""
+    if dialect_name != 'mysql':
+        return DEFAULT_MAX_ALLOWED_PACKET
+    try:
+        cursor.execute("SELECT @@max_allowed_packet")
+        return int(cursor.fetchone()[0])
+    except Exception as ex:
+        print(f"[batch-size] could not read max_allowed_packet ({ex}), assuming {DEFAULT_MAX_ALLOWED_PACKET}")
+        return DEFAULT_MAX_ALLOWED_PACKET
+
+
+class AdaptiveBatcher:
+    """
+    next_size() da el tamano del siguiente lote y record(filas, segundos) ajusta el tamano con la latencia
+    medida. Es seguro entre hilos (el productor de _BatchPrefetcher pide tamanos mientras el consumidor
+    registra latencias).
+    - max_rows: lo que cabe en packet_fraction del paquete, como mucho `max_rows`.
+    - primer lote: start_fraction de max_rows.
+    - la latencia por fila se suaviza (EWMA) y el tamano ideal es target_seconds / latencia por fila.
+    """
+
+    def __init__(self, row_width, max_allowed_packet=DEFAULT_MAX_ALLOWED_PACKET, target_seconds=0.5,
+                 min_rows=100, max_rows=100000, packet_fraction=0.9, start_fraction=0.25, smoothing=0.5,
+                 log=print):
+        self.row_width = row_width
+        self.target_seconds = target_seconds
+        self.packet_rows = max(1, int(max_allowed_packet * packet_fraction // row_width))
+        self.max_rows = max(1, min(max_rows, self.packet_rows))
+        self.min_rows = min(min_rows, self.max_rows)
+        self.size = max(self.min_rows, int(self.max_rows * start_fraction))
+        self.smoothing = smoothing
+        self.seconds_per_row = None
+        self.batches = 0
+        self.decisions = []
+        self.log = log
+        self.lock = threading.Lock()
+        self.log(f"[batch-size] row width ~{row_width} B, max_allowed_packet {max_allowed_packet} B "
+                 f"-> at most {self.max_rows} rows per batch, first batch {self.size} rows, "
+                 f"target {target_seconds:.2f}s per batch")
+
+    def next_size(self):
+        with self.lock:
+            return self.size
+
+    def record(self, rows, seconds):
+        """Latencia de un lote de `rows` filas. Los lotes cortos (final o trozos de checkpoint) no deciden."""
+        with self.lock:
+            self.batches += 1
+            if rows < self.size / 2 or rows <= 0:
+                return self.size
+            observed = seconds / rows
+            if self.seconds_per_row is None:
+                self.seconds_per_row = observed
+            else:
+                self.seconds_per_row = self.smoothing * observed + (1 - self.smoothing) * self.seconds_per_row
+            ideal = self.target_seconds / self.seconds_per_row if self.seconds_per_row > 0 else self.max_rows
+            new = int(min(max(ideal, self.size / 2), self.size * 2))
+            new = max(self.min_rows, min(self.max_rows, new))
+            if abs(new - self.size) <= self.size * 0.1:
+                action = 'hold'
+                new = self.size
+            else:
+                action = 'grow' if new > self.size else 'shrink'
+            limit = ' (packet limit)' if new == self.max_rows and action != 'shrink' else ''
+            self.decisions.append((self.batches, rows, seconds, action, new))
+            self.log(f"[batch-size] batch {self.batches}: {rows} rows in {seconds:.3f}s "
+                     f"(target {self.target_seconds:.2f}s) -> {action} {'at' if action == 'hold' else 'to'} "
+                     f"{new} rows{limit}")
+            self.size = new
+            return new
+
+
+class _SimulatedCursor:
+    def __init__(self, engine):
+        self.engine = engine
+        self.result = None
+
+    def execute(self, sql, args=None):
+        self.result = (self.engine.max_allowed_packet,) if '@@max_allowed_packet' in sql else None
+
+    def fetchone(self):
+        return self.result
+
+    def executemany(self, sql, rows):
+        rows = list(rows)
+        if len(rows) * self.engine.row_width > self.engine.max_allowed_packet:
+            raise RuntimeError(1153, "Got a packet bigger than 'max_allowed_packet' bytes")
+        self.engine.batches.append(len(rows))
+        self.engine.sleep(self.engine.latency(len(rows), len(self.engine.batches)))
+
+    def close(self):
+        pass
+
+
+class _SimulatedConnection:
+    def __init__(self, engine):
+        self.engine = engine
+
+    def cursor(self):
+        return _SimulatedCursor(self.engine)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class _SimulatedDialect:
+    name = 'mysql'
+    paramstyle = 'format'
+
+
+class SimulatedEngine:
+    """
+    Sustituto de engine para load_flight_data: raw_connection() devuelve una conexion cuyo executemany
+    tarda latency(filas, n_lote) segundos y falla como MySQL si el lote no cabe en max_allowed_packet
+    (row_width bytes por fila). `batches` guarda el tamano de cada lote.
+    """
+
+    dialect = _SimulatedDialect()
+
+    def __init__(self, latency, max_allowed_packet=DEFAULT_MAX_ALLOWED_PACKET, row_width=150, sleep=time.sleep):
+        self.latency = latency
+        self.max_allowed_packet = max_allowed_packet
+        self.row_width = row_width
+        self.sleep = sleep
+        self.batches = []
+
+    def raw_connection(self):
+        return _SimulatedConnection(self)
+
+
+def latency_curve(overhead=0.02, per_row=20e-6, knee_rows=None, knee_factor=4.0, slowdown_after=None,
+                  slowdown_factor=3.0):
+    """
+    Latencia simulada de un lote: overhead + filas * per_row. Por encima de knee_rows cada fila extra
+    cuesta knee_factor veces mas (esperas de locks, buffer pool); a partir del lote slowdown_after todo
+    va slowdown_factor veces mas lento (servidor con carga).
+    """
+    def latency(rows, batch_no):
+        seconds = overhead + rows * per_row
+        if knee_rows is not None and rows > knee_rows:
+            seconds += (rows - knee_rows) * per_row * (knee_factor - 1)
+        if slowdown_after is not None and batch_no > slowdown_after:
+            seconds *= slowdown_factor
+        return seconds
+    return latency
+
+
+def simulate(batcher, latency, total_rows):
+    """Recorre total_rows filas con el batcher y la curva de latencia sin dormir; devuelve el tiempo simulado."""
+    done = 0
+    elapsed = 0.0
+    batch_no = 0
+    while done < total_rows:
+        rows = min(batcher.next_size(), total_rows - done)
+        batch_no += 1
+        seconds = latency(rows, batch_no)
+        batcher.record(rows, seconds)
+        elapsed += seconds
+        done += rows
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulacion del tamano de lote adaptativo")
+    parser.add_argument('command', choices=['simulate'])
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--row-width', type=int, default=150, help="Bytes por fila")
+    parser.add_argument('--max-allowed-packet', type=int, default=DEFAULT_MAX_ALLOWED_PACKET)
+    parser.add_argument('--target', type=float, default=0.5, help="Latencia objetivo por lote (s)")
+    parser.add_argument('--overhead', type=float, default=0.02, help="Coste fijo por lote (s)")
+    parser.add_argument('--per-row', type=float, default=20e-6, help="Coste por fila (s)")
+    parser.add_argument('--knee-rows', type=int, help="Filas a partir de las que cada fila cuesta mas")
+    parser.add_argument('--slowdown-after', type=int, help="Lote a partir del que el servidor va mas lento")
+    parser.add_argument('--fixed', type=int, default=2000, help="Tamano fijo con el que comparar")
+    args = parser.parse_args()
+
+    latency = latency_curve(args.overhead, args.per_row, args.knee_rows, slowdown_after=args.slowdown_after)
+    batcher = AdaptiveBatcher(args.row_width, args.max_allowed_packet, target_seconds=args.target)
+    adaptive = simulate(batcher, latency, args.rows)
+    fixed = sum(latency(min(args.fixed, args.rows - start), n + 1)
+                for n, start in enumerate(range(0, args.rows, args.fixed)))
+    print(f"adaptive: {batcher.batches} batches, {adaptive:.1f}s simulated; "
+          f"fixed {args.fixed}: {math.ceil(args.rows / args.fixed)} batches, {fixed:.1f}s simulated")
+
+
+if __name__ == "__main__":
+    main()
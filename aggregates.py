@@ -0,0 +1,205 @@
+"""
+aggregates.py
+Tablas de agregados de fact_flights que construye el ETL con los hechos ya preparados en memoria
+(group-by vectorizados de pandas), para que los cuadros de mando no recorran fact_flights:
+- agg_daily_airline: por dia (date_id) y aerolinea,
+- agg_daily_origin: por dia y aeropuerto de origen,
+- agg_monthly_route: por mes (year, month) y ruta (origen, destino).
+Cada fila tiene vuelos, cancelados, desviados, suma y numero de retrasos de salida y llegada, llegadas
+con 15 min o mas de retraso, percentiles 50 y 90 del retraso de llegada y cancelaciones por motivo (A-D).
+Las filas se sustituyen por clave: los dias que trae la carga y, para la tabla mensual, los meses que
+tocan. Si de un mes solo llegan algunos dias (modo incremental), el resto del mes se lee de fact_flights
+porque los percentiles no se pueden sumar.
+Uso: python aggregates.py rebuild [YYYY-MM ...]  (recalcula desde fact_flights, mes a mes)
+"""
+
+import argparse
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+from data_preparation import expand_compact_nulls
+from read_api import bump_generation
+
+# tabla -> columnas de la clave
+AGGREGATES = {
+    'agg_daily_airline': ['date_id', 'airline_id'],
+    'agg_daily_origin': ['date_id', 'origin_airport_id'],
+    'agg_monthly_route': ['year', 'month', 'origin_airport_id', 'destination_airport_id'],
+}
+DAILY = ['agg_daily_airline', 'agg_daily_origin']
+MONTHLY = ['agg_monthly_route']
+
+# cancellation_type de la dimension -> columna cancelled_<tipo>
+CANCELLATION_TYPES = ['A', 'B', 'C', 'D']
+
+FACT_COLUMNS = ['date_id', 'airline_id', 'origin_airport_id', 'destination_airport_id', 'cancellation_id',
+                'departure_delay', 'arrival_delay', 'is_cancelled', 'is_diverted']
+
+
+class AggregateBuilder:
+    """
+    Se alimenta con update(hechos) (el DataFrame de prepare_flight_data o cada bloque en streaming) y
+    solo guarda una proyeccion compacta de las columnas que hacen falta (~30 bytes por fila).
+    `date_db` y `cancellation_db` son las dimensiones que usa prepare_flight_data.
+    """
+
+    def __init__(self, date_db, cancellation_db):
+        self.date_db = date_db[['date_id', 'year', 'month']].astype('int64')
+        types = dict(zip(cancellation_db['cancellation_id'], cancellation_db['cancellation_type']))
+        self.cancel_codes = {id_: CANCELLATION_TYPES.index(t) for id_, t in types.items() if t in CANCELLATION_TYPES}
+        self.parts = []
+
+    def _project(self, facts):
+        facts = expand_compact_nulls(facts[FACT_COLUMNS])
+        # sin date_id no hay dia ni mes al que sumar el vuelo (y el cast a int32 lo convertiria en un dia falso)
+        dated = facts['date_id'].notna()
+        if not dated.all():
+            print(f"[aggregates] {int((~dated).sum())} fact rows without date_id left out of the aggregates")
+            facts = facts[dated]
+        return pd.DataFrame({
+            'date_id': facts['date_id'].to_numpy(dtype='int32'),
+            'airline_id': facts['airline_id'].to_numpy(dtype='float32', na_value=np.nan),
+            'origin_airport_id': facts['origin_airport_id'].to_numpy(dtype='float32', na_value=np.nan),
+            'destination_airport_id': facts['destination_airport_id'].to_numpy(dtype='float32', na_value=np.nan),
+            'cancel_code': facts['cancellation_id'].map(self.cancel_codes).fillna(-1).to_numpy(dtype='int8'),
+            'departure_delay': facts['departure_delay'].to_numpy(dtype='float32', na_value=np.nan),
+            'arrival_delay': facts['arrival_delay'].to_numpy(dtype='float32', na_value=np.nan),
+            'is_cancelled': facts['is_cancelled'].to_numpy(dtype='int8', na_value=0),
+            'is_diverted': facts['is_diverted'].to_numpy(dtype='int8', na_value=0),
+        })
+
+    def update(self, facts):
+        if len(facts):
+            self.parts.append(self._project(facts))
+
+    def date_ids(self):
+        return np.unique(np.concatenate([p['date_id'].to_numpy() for p in self.parts])) if self.parts else \
+            np.array([], dtype='int32')
+
+    def months(self):
+        """(year, month) de los dias cargados."""
+        dates = self.date_db[self.date_db['date_id'].isin(self.date_ids())]
+        return sorted(set(zip(dates['year'].tolist(), dates['month'].tolist())))
+
+    def _month_complement(self, engine, months):
+        """Hechos ya guardados en fact_flights de los dias de `months` que no trae esta carga."""
+        months = set(months)
+        in_months = self.date_db[[m in months for m in zip(self.date_db['year'], self.date_db['month'])]]['date_id']
+        missing = np.setdiff1d(in_months.to_numpy(), self.date_ids())
+        if not len(missing):
+            return None
+        facts = read_facts(engine, missing)
+        print(f"[aggregates] {len(facts)} stored fact rows read to complete {len(months)} month(s)")
+        return self._project(facts) if len(facts) else None
+
+    def tables(self, engine=None):
+        """{tabla: DataFrame} listo para to_sql. Con engine, completa los meses con lo que ya hay en la BD."""
+        if not self.parts:
+            return {table: None for table in AGGREGATES}
+        data = pd.concat(self.parts, ignore_index=True)
+        result = {table: _aggregate(data, AGGREGATES[table]) for table in DAILY}
+        complement = self._month_complement(engine, self.months()) if engine is not None else None
+        if complement is not None:
+            data = pd.concat([data, complement], ignore_index=True)
+        dates = self.date_db.set_index('date_id').reindex(data['date_id'])
+        data = data.assign(year=dates['year'].to_numpy(), month=dates['month'].to_numpy())
+        for table in MONTHLY:
+            result[table] = _aggregate(data, AGGREGATES[table])
+        return result
+
+
+def _aggregate(data, keys):
+    cancelled_by_type = [f"cancelled_{t.lower()}" for t in CANCELLATION_TYPES]
+    data = data.assign(arr_delayed_15=(data['arrival_delay'] >= 15).astype('int8'),
+                       **{col: (data['cancel_code'] == i).astype('int8') for i, col in enumerate(cancelled_by_type)})
+    groups = data.groupby(keys, sort=True)
+    # una llamada por funcion con todas sus columnas (agg con un dict recorre los grupos por columna)
+    sums = groups[['is_cancelled', 'is_diverted', 'departure_delay', 'arrival_delay', 'arr_delayed_15']
+                  + cancelled_by_type].sum()
+    counts = groups[['departure_delay', 'arrival_delay']].count()
+    out = pd.DataFrame({
+        'flights': groups.size(),
+        'cancelled': sums['is_cancelled'],
+        'diverted': sums['is_diverted'],
+        'dep_delay_flights': counts['departure_delay'],
+        'dep_delay_sum': sums['departure_delay'],
+        'arr_delay_flights': counts['arrival_delay'],
+        'arr_delay_sum': sums['arrival_delay'],
+        'arr_delayed_15': sums['arr_delayed_15'],
+    })
+    out[cancelled_by_type] = sums[cancelled_by_type]
+    position = out.columns.get_loc('arr_delayed_15') + 1
+    for i, q in enumerate((0.5, 0.9)):
+        out.insert(position + i, f"arr_delay_p{int(q * 100)}", groups['arrival_delay'].quantile(q).astype('float64'))
+    # los retrasos son minutos enteros: sumas exactas como enteros
+    for col in ('dep_delay_sum', 'arr_delay_sum'):
+        out[col] = out[col].astype('float64').round().astype('int64')
+    out = out.reset_index()
+    out[keys] = out[keys].astype('int64')
+    return out
+
+
+def read_facts(engine, date_ids):
+    """Columnas FACT_COLUMNS de fact_flights para esos date_id."""
+    ids = ', '.join(str(int(i)) for i in date_ids)
+    return pd.read_sql(f"SELECT {', '.join(FACT_COLUMNS)} FROM fact_flights WHERE date_id IN ({ids})", con=engine)
+
+
+def refresh(engine, builder, date_ids=None, months=None):
+    """
+    Sustituye en una sola transaccion las filas de los dias y meses que ha visto `builder` (o de
+    `date_ids` / `months` si se indican, aunque ya no tengan hechos).
+    """
+    date_ids = builder.date_ids() if date_ids is None else date_ids
+    months = builder.months() if months is None else months
+    if not len(date_ids) and not months:
+        print("[aggregates] no facts, nothing to refresh.")
+        return
+    tables = {table: data for table, data in builder.tables(engine).items() if data is not None}
+    ids = ', '.join(str(int(i)) for i in date_ids)
+    with engine.begin() as conn:
+        for table in DAILY:
+            if ids:
+                conn.execute(text(f"DELETE FROM {table} WHERE date_id IN ({ids})"))
+        for table in MONTHLY:
+            for year, month in months:
+                conn.execute(text(f"DELETE FROM {table} WHERE year = :year AND month = :month"),
+                             {'year': year, 'month': month})
+        for table, data in tables.items():
+            data.to_sql(table, con=conn, if_exists='append', index=False)
+    print("[aggregates] refreshed " + ', '.join(f"{table}: {len(tables.get(table, ()))} rows" for table in AGGREGATES)
+          + f" ({len(date_ids)} days, {len(months)} months)")
+
+
+def rebuild(engine, months=None):
+    """Recalcula los agregados desde fact_flights, un mes cada vez (todos los de la dimension date por defecto)."""
+    date_db = pd.read_sql('SELECT date_id, year, month FROM date', con=engine)
+    cancellation_db = pd.read_sql('SELECT cancellation_id, cancellation_type FROM cancellation_reason', con=engine)
+    if months is None:
+        months = sorted(set(zip(date_db['year'].tolist(), date_db['month'].tolist())))
+    for year, month in months:
+        ids = date_db.loc[(date_db['year'] == year) & (date_db['month'] == month), 'date_id']
+        builder = AggregateBuilder(date_db, cancellation_db)
+        if len(ids):
+            builder.update(read_facts(engine, ids))
+        print(f"[aggregates] {year}-{month:02d}:")
+        refresh(engine, builder, date_ids=ids.to_numpy(), months=[(year, month)])
+
+
+def main():
+    from main import get_connection, load_db_config
+
+    parser = argparse.ArgumentParser(description="Tablas de agregados de fact_flights")
+    parser.add_argument('command', choices=['rebuild'])
+    parser.add_argument('months', nargs='*', metavar='YYYY-MM', help="Meses a recalcular (por defecto todos)")
+    args = parser.parse_args()
+    engine = get_connection(load_db_config())
+    months = [tuple(int(p) for p in m.split('-')) for m in args.months] or None
+    rebuild(engine, months)
+    bump_generation(engine)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,369 @@
+"""
+benchmark.py
+Benchmark reproducible del ETL sin el CSV real ni MySQL:
+- genera flights.csv / airports.csv / airlines.csv sinteticos y deterministas (mismas columnas,
+  NaN de cancelados/desviados, horas hhmm con 2400, codigos numericos de aeropuerto en octubre),
+- ejecuta cada etapa (parse, preparacion de dimensiones, carga de dimensiones, preparacion de hechos,
+  carga de hechos) contra un SQLite con el esquema de flights_db.sql o contra un fichero TSV,
+- mide tiempo, filas/s y pico de RSS por etapa y guarda el resultado en JSON para comparar ejecuciones.
+Uso: python benchmark.py --rows 100000 --output bench_results.json [--compare bench_prev.json]
+"""
+
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import re
+import sqlite3
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine
+
+import main
+from data_preparation import *
+from instrumentation import current_rss
+
+FLIGHTS_COLUMNS = [
+    'YEAR', 'MONTH', 'DAY', 'DAY_OF_WEEK', 'AIRLINE', 'FLIGHT_NUMBER', 'TAIL_NUMBER', 'ORIGIN_AIRPORT',
+    'DESTINATION_AIRPORT', 'SCHEDULED_DEPARTURE', 'DEPARTURE_TIME', 'DEPARTURE_DELAY', 'TAXI_OUT',
+    'WHEELS_OFF', 'SCHEDULED_TIME', 'ELAPSED_TIME', 'AIR_TIME', 'DISTANCE', 'WHEELS_ON', 'TAXI_IN',
+    'SCHEDULED_ARRIVAL', 'ARRIVAL_TIME', 'ARRIVAL_DELAY', 'DIVERTED', 'CANCELLED', 'CANCELLATION_REASON',
+    'AIR_SYSTEM_DELAY', 'SECURITY_DELAY', 'AIRLINE_DELAY', 'LATE_AIRCRAFT_DELAY', 'WEATHER_DELAY'
+]
+
+# Aerolineas de flights.csv (2015) con un peso aproximado de su numero de vuelos
+AIRLINES = [
+    ('WN', 'Southwest Airlines Co.', 0.22), ('DL', 'Delta Air Lines Inc.', 0.15),
+    ('AA', 'American Airlines Inc.', 0.12), ('OO', 'Skywest Airlines Inc.', 0.10),
+    ('EV', 'Atlantic Southeast Airlines', 0.10), ('UA', 'United Air Lines Inc.', 0.09),
+    ('MQ', 'American Eagle Airlines Inc.', 0.05), ('B6', 'JetBlue Airways', 0.05),
+    ('US', 'US Airways Inc.', 0.03), ('AS', 'Alaska Airlines Inc.', 0.03),
+    ('NK', 'Spirit Air Lines', 0.02), ('F9', 'Frontier Airlines Inc.', 0.02),
+    ('HA', 'Hawaiian Airlines Inc.', 0.01), ('VX', 'Virgin America', 0.01),
+]
+
+CANCELLATION_REASONS = [('A', 0.27), ('B', 0.54), ('C', 0.18), ('D', 0.01)]
+
+N_AIRPORTS = 322
+CANCELLED_RATE = 0.015
+DIVERTED_RATE = 0.0026
+GENERATOR_CHUNKSIZE = 1000000
+
+
+def _to_hhmm(minutes):
+    """Minutos desde medianoche -> hhmm como en flights.csv (la medianoche se escribe 2400)."""
+    m = np.mod(minutes, 1440)
+    hhmm = (m // 60) * 100 + m % 60
+    return np.where(m == 0, 2400, hhmm)
+
+
+def _synthetic_airports(seed):
+    rng = np.random.default_rng([seed, 0])
+    letters = np.array(list('ABCDEFGHIJKLMNOPQRSTUVWXYZ'))
+    codes = []
+    seen = set()
+    while len(codes) < N_AIRPORTS:
+        code = ''.join(rng.choice(letters, 3))
+        if code not in seen:
+            seen.add(code)
+            codes.append(code)
+    return pd.DataFrame({
+        'IATA_CODE': codes,
+        'AIRPORT': [f"{c} Regional Airport" for c in codes],
+        'CITY': [f"City {c}" for c in codes],
+        'STATE': rng.choice(['CA', 'TX', 'FL', 'NY', 'IL', 'GA', 'CO', 'WA', 'AZ', 'NC'], N_AIRPORTS),
+        'COUNTRY': 'USA',
+        'LATITUDE': np.round(rng.uniform(25.0, 48.5, N_AIRPORTS), 5),
+        'LONGITUDE': np.round(rng.uniform(-124.0, -68.0, N_AIRPORTS), 5),
+    })
+
+
+def _haversine_miles(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 3958.8 * 2 * np.arcsin(np.sqrt(a))
+
+
+def _synthetic_flights_chunk(seed, chunk_no, start, end, total, airports, tails):
+    rng = np.random.default_rng([seed, 1, chunk_no])
+    n = end - start
+    days = pd.Timestamp('2015-01-01') + pd.to_timedelta((np.arange(start, end) * 365) // total, unit='D')
+
+    airline_codes = np.array([a[0] for a in AIRLINES])
+    airline_w = np.array([a[2] for a in AIRLINES])
+    # popularidad tipo Zipf de los aeropuertos
+    airport_w = 1.0 / np.arange(1, N_AIRPORTS + 1)
+    airport_w /= airport_w.sum()
+    origin = rng.choice(N_AIRPORTS, n, p=airport_w)
+    dest = (origin + 1 + rng.choice(N_AIRPORTS - 1, n, p=airport_w[:-1] / airport_w[:-1].sum())) % N_AIRPORTS
+
+    lat = airports['LATITUDE'].to_numpy()
+    lon = airports['LONGITUDE'].to_numpy()
+    distance = np.maximum(np.round(_haversine_miles(lat[origin], lon[origin], lat[dest], lon[dest])), 31)
+
+    sched_dep = np.clip(np.round(rng.normal(800, 270, n)), 300, 1439).astype('int64')
+    sched_time = np.round(distance / 8.0 + 35 + rng.normal(0, 8, n))
+    dep_delay = np.round(rng.normal(-3, 5, n) + np.where(rng.random(n) < 0.2, rng.exponential(40, n), 0))
+    taxi_out = np.round(rng.gamma(4, 4, n)) + 3
+    air_time = np.round(distance / 7.7 + rng.normal(5, 6, n)).clip(10)
+    taxi_in = np.round(rng.gamma(2, 3.5, n)) + 1
+    elapsed = taxi_out + air_time + taxi_in
+    arr_delay = dep_delay + elapsed - sched_time
+
+    cancelled = rng.random(n) < CANCELLED_RATE
+    diverted = ~cancelled & (rng.random(n) < DIVERTED_RATE)
+    reasons = np.array([r[0] for r in CANCELLATION_REASONS])
+    reason = np.where(cancelled, rng.choice(reasons, n, p=[r[1] for r in CANCELLATION_REASONS]), None)
+
+    def nan_if(mask, values):
+        return np.where(mask, np.nan, values)
+
+    dep_time = sched_dep + dep_delay
+    wheels_off = dep_time + taxi_out
+    wheels_on = wheels_off + air_time
+    arr_time = wheels_on + taxi_in
+    no_arrival = cancelled | diverted
+
+    origin_codes = airports['IATA_CODE'].to_numpy()[origin].astype(object)
+    dest_codes = airports['IATA_CODE'].to_numpy()[dest].astype(object)
+    # en octubre de 2015 flights.csv trae codigos numericos de aeropuerto en lugar del IATA
+    october = days.month.to_numpy() == 10
+    origin_codes[october] = (10000 + origin[october] * 7).astype(str)
+    dest_codes[october] = (10000 + dest[october] * 7).astype(str)
+
+    tail = tails[rng.integers(0, len(tails), n)].astype(object)
+    tail[rng.random(n) < 0.0025] = None
+
+    df = pd.DataFrame({
+        'YEAR': days.year, 'MONTH': days.month, 'DAY': days.day, 'DAY_OF_WEEK': days.dayofweek + 1,
+        'AIRLINE': rng.choice(airline_codes, n, p=airline_w / airline_w.sum()),
+        'FLIGHT_NUMBER': rng.integers(1, 7000, n),
+        'TAIL_NUMBER': tail,
+        'ORIGIN_AIRPORT': origin_codes,
+        'DESTINATION_AIRPORT': dest_codes,
+        'SCHEDULED_DEPARTURE': _to_hhmm(sched_dep),
+        'DEPARTURE_TIME': nan_if(cancelled, _to_hhmm(dep_time)),
+        'DEPARTURE_DELAY': nan_if(cancelled, dep_delay),
+        'TAXI_OUT': nan_if(cancelled, taxi_out),
+        'WHEELS_OFF': nan_if(cancelled, _to_hhmm(wheels_off)),
+        'SCHEDULED_TIME': sched_time,
+        'ELAPSED_TIME': nan_if(no_arrival, elapsed),
+        'AIR_TIME': nan_if(no_arrival, air_time),
+        'DISTANCE': distance.astype('int64'),
+        'WHEELS_ON': nan_if(no_arrival, _to_hhmm(wheels_on)),
+        'TAXI_IN': nan_if(no_arrival, taxi_in),
+        'SCHEDULED_ARRIVAL': _to_hhmm(sched_dep + sched_time.astype('int64')),
+        'ARRIVAL_TIME': nan_if(no_arrival, _to_hhmm(arr_time)),
+        'ARRIVAL_DELAY': nan_if(no_arrival, arr_delay),
+        'DIVERTED': diverted.astype('int64'),
+        'CANCELLED': cancelled.astype('int64'),
+        'CANCELLATION_REASON': reason,
+    })
+    # desglose del retraso solo para vuelos con ARRIVAL_DELAY >= 15 (como en el fichero original)
+    late = (df['ARRIVAL_DELAY'] >= 15).to_numpy()
+    split = rng.dirichlet(np.ones(5), n) * np.nan_to_num(arr_delay)[:, None]
+    for k, col in enumerate(['AIR_SYSTEM_DELAY', 'SECURITY_DELAY', 'AIRLINE_DELAY', 'LATE_AIRCRAFT_DELAY',
+                             'WEATHER_DELAY']):
+        df[col] = np.where(late, np.floor(split[:, k]), np.nan)
+    return df[FLIGHTS_COLUMNS]
+
+
+def generate_synthetic_sources(out_dir, rows, seed=0, chunksize=GENERATOR_CHUNKSIZE):
+    """Escribe flights.csv, airports.csv y airlines.csv sinteticos en out_dir. Misma semilla -> mismos ficheros."""
+    os.makedirs(out_dir, exist_ok=True)
+    airports = _synthetic_airports(seed)
+    airports.to_csv(os.path.join(out_dir, 'airports.csv'), index=False)
+    pd.DataFrame({'IATA_CODE': [a[0] for a in AIRLINES], 'AIRLINE': [a[1] for a in AIRLINES]}).to_csv(
+        os.path.join(out_dir, 'airlines.csv'), index=False)
+
+    rng = np.random.default_rng([seed, 2])
+    alnum = np.array(list('ABCDEFGHJKLMNPRSTUVWXYZ0123456789'))
+    tails = np.array(['N' + ''.join(rng.choice(alnum, rng.integers(3, 6))) for _ in range(4900)])
+
+    path = os.path.join(out_dir, 'flights.csv')
+    for chunk_no, start in enumerate(range(0, rows, chunksize)):
+        end = min(start + chunksize, rows)
+        chunk = _synthetic_flights_chunk(seed, chunk_no, start, end, rows, airports, tails)
+        chunk.to_csv(path, mode='w' if chunk_no == 0 else 'a', header=chunk_no == 0, index=False)
+    return {'flights': path, 'airports': os.path.join(out_dir, 'airports.csv'),
+            'airlines': os.path.join(out_dir, 'airlines.csv')}
+
+
+def sqlite_schema(sql_path='flights_db.sql'):
+    """Traduce flights_db.sql (MySQL) a SQLite: sin CREATE DATABASE/USE ni ENGINE, AUTOINCREMENT."""
+    with open(sql_path, 'r', encoding='utf-8') as f:
+        sql = f.read()
+    sql = re.sub(r'(?im)^\s*(CREATE DATABASE|USE)\b[^;]*;', '', sql)
+    sql = re.sub(r'(?i)\bINT AUTO_INCREMENT PRIMARY KEY', 'INTEGER PRIMARY KEY AUTOINCREMENT', sql)
+    sql = re.sub(r'(?i)\)\s*ENGINE\s*=\s*InnoDB[^;]*;', ');', sql)
+    return sql
+
+
+def _adapt_timedelta(td):
+    secs = int(td.total_seconds())
+    return f"{secs // 3600:02d}:{(secs % 3600) // 60:02d}:{secs % 60:02d}"
+
+
+def sqlite_engine(db_path, sql_path='flights_db.sql'):
+    """Engine SQLAlchemy sobre un SQLite nuevo con el esquema de flights_db.sql (sustituto de MySQL)."""
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    sqlite3.register_adapter(datetime.timedelta, _adapt_timedelta)
+    engine = create_engine(f"sqlite:///{db_path}")
+    raw = engine.raw_connection()
+    try:
+        raw.executescript(sqlite_schema(sql_path))
+        raw.commit()
+    finally:
+        raw.close()
+    return engine
+
+
+class _PeakRSS:
+    """Muestrea el RSS en un hilo mientras dura el bloque with y guarda el pico."""
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+
+    def _sample(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, current_rss())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.start = current_rss()
+        self.peak = self.start
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.end = current_rss()
+        self.peak = max(self.peak, self.end)
+        return False
+
+
+def run_stage(results, name, rows, fn, verbose=False):
+    """Ejecuta fn() midiendo tiempo y RSS; anade el resultado a `results` y devuelve lo que devuelva fn."""
+    out = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+    with _PeakRSS() as rss, out:
+        t0 = time.perf_counter()
+        value = fn()
+        wall = time.perf_counter() - t0
+    n = rows(value) if callable(rows) else rows
+    stage = {'stage': name, 'rows': n, 'wall_s': round(wall, 4),
+             'rows_per_s': round(n / wall, 1) if wall > 0 else None,
+             'peak_rss_mb': round(rss.peak / 2**20, 1),
+             'rss_delta_mb': round((rss.end - rss.start) / 2**20, 1)}
+    results.append(stage)
+    print(f"{name:<16} {n:>10} rows {wall:>9.3f}s {stage['rows_per_s'] or 0:>12.0f} rows/s "
+          f"peak RSS {stage['peak_rss_mb']:>8.1f} MB")
+    return value
+
+
+def run_benchmark(rows, seed=0, workdir='bench_data', sink='sqlite', load_chunksize=2000,
+                  csv_engine='c', regenerate=False, verbose=False):
+    sources = {k: os.path.join(workdir, f"{k}.csv") for k in ('flights', 'airports', 'airlines')}
+    meta_path = os.path.join(workdir, 'generated.json')
+    meta = {}
+    if os.path.exists(meta_path):
+        with open(meta_path) as f:
+            meta = json.load(f)
+    if regenerate or meta != {'rows': rows, 'seed': seed}:
+        print(f"Generating synthetic sources ({rows} rows, seed {seed}) in {workdir} ...")
+        generate_synthetic_sources(workdir, rows, seed)
+        with open(meta_path, 'w') as f:
+            json.dump({'rows': rows, 'seed': seed}, f)
+
+    results = []
+    engine = sqlite_engine(os.path.join(workdir, 'flights_db.sqlite'))
+
+    flights = run_stage(results, 'parse', len, lambda: read_flights_csv(sources['flights'], engine=csv_engine),
+                        verbose)
+    airlines = pd.read_csv(sources['airlines'])
+    airports = pd.read_csv(sources['airports'])
+
+    dims = run_stage(results, 'dimension_prep', len(flights), lambda: (
+        prepare_airline_data(airlines), prepare_airport_data(airports), *extract_dimension_data(flights)), verbose)
+
+    def load_dimensions():
+        main.load_airline_data(engine, dims[0])
+        main.load_airport_data(engine, dims[1])
+        main.load_date_data(engine, dims[2])
+        main.load_cancellation_data(engine, dims[3])
+        return (pd.read_sql('SELECT cancellation_id, cancellation_type FROM cancellation_reason', con=engine),
+                pd.read_sql('SELECT date_id, year, month, day FROM date', con=engine),
+                pd.read_sql('SELECT airport_id, iata_code FROM airport', con=engine),
+                pd.read_sql('SELECT airline_id, airline_iata FROM airline', con=engine))
+
+    dim_db = run_stage(results, 'dimension_load', sum(len(d) for d in dims), load_dimensions, verbose)
+
+    facts = run_stage(results, 'fact_prep', len(flights), lambda: prepare_flight_data(flights, *dim_db), verbose)
+    del flights
+
+    if sink == 'sqlite':
+        run_stage(results, 'fact_load', len(facts),
+                  lambda: main.load_flight_data(engine, facts, chunksize=load_chunksize), verbose)
+    else:
+        def write_tsv():
+            with open(os.path.join(workdir, 'fact_flights.tsv'), 'w', encoding='utf-8', newline='') as f:
+                return main.write_fact_tsv(facts, f)
+        run_stage(results, 'fact_load', len(facts), write_tsv, verbose)
+
+    return {
+        'meta': {'rows': rows, 'seed': seed, 'sink': sink, 'load_chunksize': load_chunksize,
+                 'csv_engine': csv_engine, 'python': platform.python_version(), 'pandas': pd.__version__,
+                 'numpy': np.__version__, 'platform': platform.platform(),
+                 'timestamp': datetime.datetime.now().isoformat(timespec='seconds')},
+        'stages': results,
+    }
+
+
+def compare(current, previous):
+    """Imprime la relacion de tiempos por etapa respecto a un JSON anterior (>1 = mas rapido ahora)."""
+    prev = {s['stage']: s for s in previous['stages']}
+    print(f"\nComparison with previous run ({previous['meta'].get('timestamp')}, {previous['meta'].get('rows')} rows):")
+    for s in current['stages']:
+        p = prev.get(s['stage'])
+        if p and s['wall_s'] > 0:
+            print(f"{s['stage']:<16} {p['wall_s']:>9.3f}s -> {s['wall_s']:>9.3f}s  x{p['wall_s'] / s['wall_s']:.2f}  "
+                  f"peak RSS {p['peak_rss_mb']:.1f} -> {s['peak_rss_mb']:.1f} MB")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark del ETL con datos sinteticos y SQLite")
+    parser.add_argument('--rows', type=int, default=100000, help="Filas de flights.csv sintetico (10k - 10M)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workdir', default='bench_data', help="Directorio para los CSV y el SQLite")
+    parser.add_argument('--sink', choices=['sqlite', 'tsv'], default='sqlite',
+                        help="Destino de fact_flights: SQLite (executemany) o fichero TSV (LOAD DATA)")
+    parser.add_argument('--load-chunksize', type=int, default=2000)
+    parser.add_argument('--csv-engine', choices=['c', 'pyarrow'], default='c')
+    parser.add_argument('--regenerate', action='store_true', help="Regenerar los CSV aunque ya existan")
+    parser.add_argument('--output', default='bench_results.json', help="Fichero JSON con los resultados")
+    parser.add_argument('--compare', help="JSON de una ejecucion anterior para comparar")
+    parser.add_argument('--verbose', action='store_true', help="Mostrar la salida de las funciones del ETL")
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    report = run_benchmark(args.rows, seed=args.seed, workdir=args.workdir, sink=args.sink,
+                           load_chunksize=args.load_chunksize, csv_engine=args.csv_engine,
+                           regenerate=args.regenerate, verbose=args.verbose)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
@@ -0,0 +1,282 @@
+"""
+bulk_load.py
+Modo de carga masiva de fact_flights (MySQL/InnoDB):
+- antes de la carga se quitan las FOREIGN KEY y los indices secundarios de fact_flights; sus definiciones
+  se guardan en etl_state para poder restaurarlos aunque la carga se interrumpa,
+- las conexiones de la carga usan unique_checks=0, foreign_key_checks=0 y READ COMMITTED,
+- despues se comprueba en una sola pasada que no haya hechos huerfanos y se recrean todos los indices y
+  FK con un unico ALTER TABLE.
+Tambien gestiona las particiones por mes de flights_db_partitioned.sql (RANGE sobre date_id), para poder
+recargar un mes con TRUNCATE PARTITION en lugar de DELETE.
+Uso: python bulk_load.py status|restore|partitions|truncate YYYY-MM
+"""
+
+import argparse
+import json
+
+import pandas as pd
+from sqlalchemy import event, text
+
+from read_api import bump_generation
+
+FACT_TABLE = 'fact_flights'
+STATE_KEY = 'bulk_load_dropped'
+
+# Referencias de fact_flights (columna, tabla, columna) de flights_db.sql; se validan tambien en la
+# variante particionada, que no puede tener FOREIGN KEY
+FACT_REFERENCES = [
+    ('airline_id', 'airline', 'airline_id'),
+    ('origin_airport_id', 'airport', 'airport_id'),
+    ('destination_airport_id', 'airport', 'airport_id'),
+    ('date_id', 'date', 'date_id'),
+    ('cancellation_id', 'cancellation_reason', 'cancellation_id'),
+    ('route_id', 'route', 'route_id'),
+]
+
+BULK_SESSION_SQL = [
+    "SET SESSION unique_checks = 0",
+    "SET SESSION foreign_key_checks = 0",
+    "SET SESSION TRANSACTION ISOLATION LEVEL READ COMMITTED",
+]
+
+
+def _read_sql(engine, sql, **params):
+    return pd.read_sql(text(sql), con=engine, params=params)
+
+
+def fact_foreign_keys(engine, table=FACT_TABLE):
+    """FOREIGN KEY de la tabla segun information_schema: [{name, columns, ref_table, ref_columns, ...}]."""
+    rows = _read_sql(engine, """
+        SELECT k.CONSTRAINT_NAME AS name, k.COLUMN_NAME AS col, k.REFERENCED_TABLE_NAME AS ref_table,
+               k.REFERENCED_COLUMN_NAME AS ref_col, r.UPDATE_RULE AS on_update, r.DELETE_RULE AS on_delete
+        FROM information_schema.KEY_COLUMN_USAGE k
+        JOIN information_schema.REFERENTIAL_CONSTRAINTS r
+          ON r.CONSTRAINT_SCHEMA = k.CONSTRAINT_SCHEMA AND r.CONSTRAINT_NAME = k.CONSTRAINT_NAME
+        WHERE k.TABLE_SCHEMA = DATABASE() AND k.TABLE_NAME = :table AND k.REFERENCED_TABLE_NAME IS NOT NULL
+        ORDER BY k.CONSTRAINT_NAME, k.ORDINAL_POSITION""", table=table)
+    fks = []
+    for name, group in rows.groupby('name', sort=False):
+        first = group.iloc[0]
+        fks.append({'name': name, 'columns': group['col'].tolist(), 'ref_table': first['ref_table'],
+                    'ref_columns': group['ref_col'].tolist(), 'on_update': first['on_update'],
+                    'on_delete': first['on_delete']})
+    return fks
+
+
+def fact_indexes(engine, table=FACT_TABLE):
+    """Indices secundarios (todos menos PRIMARY): [{name, unique, columns: [[col, sub_part], ...]}]."""
+    rows = _read_sql(engine, """
+        SELECT INDEX_NAME AS name, NON_UNIQUE AS non_unique, COLUMN_NAME AS col, SUB_PART AS sub_part
+        FROM information_schema.STATISTICS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :table AND INDEX_NAME <> 'PRIMARY'
+        ORDER BY INDEX_NAME, SEQ_IN_INDEX""", table=table)
+    indexes = []
+    for name, group in rows.groupby('name', sort=False):
+        indexes.append({'name': name, 'unique': not int(group['non_unique'].iloc[0]),
+                        'columns': [[c, None if pd.isna(s) else int(s)] for c, s in zip(group['col'], group['sub_part'])]})
+    return indexes
+
+
+def _index_sql(index):
+    cols = ', '.join(f"`{c}`" + (f"({s})" if s else '') for c, s in index['columns'])
+    return f"ADD {'UNIQUE ' if index['unique'] else ''}INDEX `{index['name']}` ({cols})"
+
+
+def _foreign_key_sql(fk):
+    cols = ', '.join(f"`{c}`" for c in fk['columns'])
+    ref_cols = ', '.join(f"`{c}`" for c in fk['ref_columns'])
+    return (f"ADD CONSTRAINT `{fk['name']}` FOREIGN KEY ({cols}) REFERENCES `{fk['ref_table']}` ({ref_cols}) "
+            f"ON UPDATE {fk['on_update']} ON DELETE {fk['on_delete']}")
+
+
+def read_state(engine):
+    state = _read_sql(engine, "SELECT state_value FROM etl_state WHERE state_key = :key", key=STATE_KEY)
+    return json.loads(state['state_value'].iloc[0]) if len(state) else None
+
+
+def _write_state(engine, state):
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM etl_state WHERE state_key = :key"), {'key': STATE_KEY})
+        if state is not None:
+            conn.execute(text("INSERT INTO etl_state (state_key, state_value) VALUES (:key, :value)"),
+                         {'key': STATE_KEY, 'value': json.dumps(state)})
+
+
+def _bulk_session(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for sql in BULK_SESSION_SQL:
+        cursor.execute(sql)
+    cursor.close()
+
+
+def _set_bulk_session(engine, enabled):
+    """Aplica (o deja de aplicar) BULK_SESSION_SQL a cada conexion nueva del engine."""
+    if enabled and not event.contains(engine, 'connect', _bulk_session):
+        event.listen(engine, 'connect', _bulk_session)
+    elif not enabled and event.contains(engine, 'connect', _bulk_session):
+        event.remove(engine, 'connect', _bulk_session)
+    # las conexiones que ya estan en el pool se abrieron con la otra configuracion
+    engine.dispose()
+
+
+def begin_bulk_load(engine):
+    """
+    Quita FK e indices secundarios de fact_flights (guardando sus definiciones en etl_state) y activa la
+    configuracion de sesion de carga masiva. Si una carga anterior no termino, los indices siguen quitados
+    y se reutiliza lo guardado.
+    """
+    if engine.dialect.name != 'mysql':
+        print(f"[bulk_load] {engine.dialect.name} is not MySQL, bulk mode skipped")
+        return None
+    state = read_state(engine)
+    if state is not None:
+        print("[bulk_load] indexes already dropped by a previous bulk load that did not finish")
+    else:
+        state = {'foreign_keys': fact_foreign_keys(engine), 'indexes': fact_indexes(engine)}
+        # primero se guarda el estado: si algo falla despues siempre se puede restaurar
+        _write_state(engine, state)
+        with engine.begin() as conn:
+            if state['foreign_keys']:
+                conn.execute(text(f"ALTER TABLE {FACT_TABLE} " +
+                                  ', '.join(f"DROP FOREIGN KEY `{fk['name']}`" for fk in state['foreign_keys'])))
+            if state['indexes']:
+                conn.execute(text(f"ALTER TABLE {FACT_TABLE} " +
+                                  ', '.join(f"DROP INDEX `{ix['name']}`" for ix in state['indexes'])))
+        print(f"[bulk_load] dropped {len(state['foreign_keys'])} foreign keys and "
+              f"{len(state['indexes'])} secondary indexes of {FACT_TABLE}")
+    _set_bulk_session(engine, True)
+    return state
+
+
+def count_orphans(engine):
+    """Hechos cuyo id no existe en la dimension, por columna, con una sola pasada por fact_flights."""
+    joins = []
+    sums = []
+    for i, (col, ref_table, ref_col) in enumerate(FACT_REFERENCES):
+        joins.append(f"LEFT JOIN `{ref_table}` r{i} ON r{i}.`{ref_col}` = f.`{col}`")
+        sums.append(f"COALESCE(SUM(f.`{col}` IS NOT NULL AND r{i}.`{ref_col}` IS NULL), 0) AS `{col}`")
+    counts = _read_sql(engine, f"SELECT {', '.join(sums)} FROM {FACT_TABLE} f {' '.join(joins)}")
+    return {col: int(n) for col, n in counts.iloc[0].items()}
+
+
+def restore_indexes(engine, state):
+    """Vuelve a crear indices y FK guardados con un unico ALTER TABLE (una sola reconstruccion)."""
+    clauses = [_index_sql(ix) for ix in state['indexes']] + [_foreign_key_sql(fk) for fk in state['foreign_keys']]
+    if clauses:
+        with engine.begin() as conn:
+            # ya se ha validado con count_orphans: sin foreign_key_checks InnoDB anade las FK in-place
+            conn.execute(text("SET SESSION foreign_key_checks = 0"))
+            conn.execute(text(f"ALTER TABLE {FACT_TABLE} " + ', '.join(clauses)))
+            conn.execute(text("SET SESSION foreign_key_checks = 1"))
+    _write_state(engine, None)
+    print(f"[bulk_load] rebuilt {len(state['indexes'])} indexes and {len(state['foreign_keys'])} foreign keys")
+
+
+def finish_bulk_load(engine):
+    """Desactiva la sesion de carga masiva, valida las referencias y restaura indices y FK."""
+    if engine.dialect.name != 'mysql':
+        return
+    _set_bulk_session(engine, False)
+    state = read_state(engine)
+    if state is None:
+        return
+    orphans = {col: n for col, n in count_orphans(engine).items() if n}
+    if orphans:
+        print(f"[bulk_load] orphan fact rows per column: {orphans}")
+        raise RuntimeError("fact_flights has rows without a matching dimension row; indexes and foreign keys "
+                           "were not restored. Fix the data and run: python bulk_load.py restore")
+    restore_indexes(engine, state)
+
+
+def partitions(engine):
+    """Particiones de fact_flights: [(nombre, limite)] con limite None para MAXVALUE; [] si no esta particionada."""
+    rows = _read_sql(engine, """
+        SELECT PARTITION_NAME AS name, PARTITION_DESCRIPTION AS bound
+        FROM information_schema.PARTITIONS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :table AND PARTITION_NAME IS NOT NULL
+        ORDER BY PARTITION_ORDINAL_POSITION""", table=FACT_TABLE)
+    return [(name, None if str(bound).upper() == 'MAXVALUE' else int(bound))
+            for name, bound in zip(rows['name'], rows['bound'])]
+
+
+def month_partition_bounds(date_db):
+    """
+    [(pYYYYMM, primer date_id del mes siguiente)] para cada mes de la dimension date que ya tiene un mes
+    posterior (el ultimo mes se queda en pmax hasta que llegue el siguiente).
+    Requiere que date_id crezca con la fecha.
+    """
+    dates = date_db.sort_values('date_id')
+    months = (dates['year'] * 100 + dates['month']).to_numpy()
+    if (months[1:] < months[:-1]).any():
+        raise ValueError("date_id does not grow with the date; month partitions need chronological date ids")
+    first_id = dates.groupby(months, sort=True)['date_id'].min()
+    return [(f"p{m}", int(next_first)) for m, next_first in zip(first_id.index[:-1], first_id.to_numpy()[1:])]
+
+
+def ensure_month_partitions(engine):
+    """Divide pmax en una particion por cada mes nuevo de la dimension date (flights_db_partitioned.sql)."""
+    if engine.dialect.name != 'mysql':
+        return
+    current = partitions(engine)
+    if not current:
+        return
+    if current[-1] != ('pmax', None):
+        raise ValueError("the last partition of fact_flights must be pmax VALUES LESS THAN MAXVALUE")
+    last_bound = max([b for _, b in current if b is not None], default=0)
+    date_db = _read_sql(engine, "SELECT date_id, year, month FROM date")
+    new = [(name, bound) for name, bound in month_partition_bounds(date_db) if bound > last_bound]
+    if not new:
+        return
+    parts = ', '.join(f"PARTITION {name} VALUES LESS THAN ({bound})" for name, bound in new)
+    with engine.begin() as conn:
+        conn.execute(text(f"ALTER TABLE {FACT_TABLE} REORGANIZE PARTITION pmax INTO "
+                          f"({parts}, PARTITION pmax VALUES LESS THAN MAXVALUE)"))
+    print(f"[bulk_load] added partitions {', '.join(name for name, _ in new)}")
+
+
+def truncate_month(engine, year, month):
+    """Vacia los hechos de un mes con TRUNCATE PARTITION (sin DELETE fila a fila)."""
+    name = f"p{year}{month:02d}"
+    if name not in [n for n, _ in partitions(engine)]:
+        raise ValueError(f"fact_flights has no partition {name}")
+    with engine.begin() as conn:
+        conn.execute(text(f"ALTER TABLE {FACT_TABLE} TRUNCATE PARTITION {name}"))
+    print(f"[bulk_load] partition {name} truncated")
+
+
+def main():
+    from main import get_connection, load_db_config
+
+    parser = argparse.ArgumentParser(description="Indices, FK y particiones de fact_flights para la carga masiva")
+    parser.add_argument('command', choices=['status', 'restore', 'partitions', 'truncate'])
+    parser.add_argument('month', nargs='?', help="YYYY-MM (solo truncate)")
+    args = parser.parse_args()
+    engine = get_connection(load_db_config())
+
+    if args.command == 'status':
+        state = read_state(engine)
+        if state is None:
+            print("No bulk load in progress: indexes and foreign keys are in place.")
+        else:
+            print(f"Bulk load in progress: {len(state['indexes'])} indexes and "
+                  f"{len(state['foreign_keys'])} foreign keys dropped.")
+        for name, bound in partitions(engine):
+            print(f"  {name}: date_id < {bound if bound is not None else 'MAXVALUE'}")
+    elif args.command == 'restore':
+        state = read_state(engine)
+        if state is None:
+            print("Nothing to restore.")
+        else:
+            finish_bulk_load(engine)
+    elif args.command == 'partitions':
+        ensure_month_partitions(engine)
+    else:
+        if not args.month:
+            parser.error("truncate needs the month as YYYY-MM")
+        year, month = (int(p) for p in args.month.split('-'))
+        truncate_month(engine, year, month)
+        bump_generation(engine)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+"""
+change_capture.py
+Deteccion de cambios para volver a cargar entregas repetidas de flights.csv (main.py --changes-only):
+solo se insertan los hechos nuevos o cambiados en lugar de todo el fichero.
+- Cada hecho preparado tiene un hash de 64 bits de todas sus columnas (pd.util.hash_pandas_object,
+  vectorizado) y una clave natural (date_id, airline_id, flight_number, origin_airport_id,
+  scheduled_departure); las filas con la misma clave se numeran por orden de aparicion.
+- Los hashes y la clave se guardan en un fichero indice local (.npz, ~36 bytes por hecho).
+- Al recargar, un grupo de clave natural con alguna fila nueva, cambiada o desaparecida se borra de la
+  tabla de hechos y se inserta entero otra vez; el resto no se toca. Los dias de la entrega sustituyen
+  a los del indice (una fila del indice que no vuelve a llegar se borra).
+- Antes se comparan las filas por dia de la tabla con las del indice: un dia que no coincide (indice
+  nuevo, BD recreada, carga interrumpida) se borra y se carga entero.
+No esta pensado para dos ETL escribiendo a la vez en la misma tabla.
+"""
+
+import datetime
+import os
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+from data_preparation import _compact_ints, expand_compact_nulls
+
+INDEX_PATH = os.path.join("Data", ".change_index.npz")
+
+# clave natural -> tipo entero con que se guarda en el indice (minimo del tipo = NULL)
+KEY_DTYPES = {
+    'date_id': 'int32',
+    'airline_id': 'int32',
+    'flight_number': 'int32',
+    'origin_airport_id': 'int32',
+    'scheduled_departure': 'int16',  # minutos del dia
+}
+KEY_COLUMNS = list(KEY_DTYPES)
+
+# (hash del grupo, numero de aparicion) -> una sola clave de 64 bits
+_OCCURRENCE_MIX = np.uint64(0x9E3779B97F4A7C15)
+DELETE_GROUPS_PER_STATEMENT = 200
+
+
+def _hashable(facts):
+    """Columnas de hechos con tipos estables entre ejecuciones: numeros float64/NaN, horas en segundos, texto str."""
+    facts = expand_compact_nulls(facts)
+    columns = {}
+    for col in facts.columns:
+        ser = facts[col]
+        if pd.api.types.is_timedelta64_dtype(ser.dtype):
+            columns[col] = ser.dt.total_seconds().to_numpy(dtype='float64')
+        elif pd.api.types.is_numeric_dtype(ser.dtype) or pd.api.types.is_bool_dtype(ser.dtype):
+            columns[col] = ser.to_numpy(dtype='float64', na_value=np.nan)
+        else:
+            columns[col] = ser.astype(str).to_numpy(dtype=object)
+    return pd.DataFrame(columns)
+
+
+def row_hashes(facts):
+    """Hash de 64 bits de cada fila (todas las columnas, sin el indice)."""
+    return pd.util.hash_pandas_object(_hashable(facts), index=False).to_numpy()
+
+
+def key_values(facts):
+    """Clave natural como enteros compactos; scheduled_departure en minutos del dia."""
+    keys = expand_compact_nulls(facts[KEY_COLUMNS])
+    sched = keys['scheduled_departure']
+    if pd.api.types.is_timedelta64_dtype(sched.dtype):
+        keys = keys.assign(scheduled_departure=sched.dt.total_seconds() / 60)
+    return pd.DataFrame({col: _compact_ints(keys[col], dtype, col) for col, dtype in KEY_DTYPES.items()})
+
+
+def _entries(facts):
+    keys = key_values(facts)
+    group = pd.util.hash_pandas_object(keys, index=False).to_numpy()
+    occurrence = pd.Series(group).groupby(group, sort=False).cumcount().to_numpy(dtype='uint16')
+    arrays = {col: keys[col].to_numpy() for col in KEY_COLUMNS}
+    arrays.update(group=group, occurrence=occurrence, row_hash=row_hashes(facts))
+    return arrays
+
+
+def _empty_entries():
+    arrays = {col: np.empty(0, dtype=dtype) for col, dtype in KEY_DTYPES.items()}
+    arrays.update(group=np.empty(0, dtype='uint64'), occurrence=np.empty(0, dtype='uint16'),
+                  row_hash=np.empty(0, dtype='uint64'))
+    return arrays
+
+
+def _entry_keys(arrays):
+    return arrays['group'] + arrays['occurrence'].astype('uint64') * _OCCURRENCE_MIX
+
+
+def _select(arrays, mask):
+    return {name: values[mask] for name, values in arrays.items()}
+
+
+class ChangeSet:
+    """
+    Resultado de ChangeIndex.diff: `facts` son las filas a insertar, `delete_keys` los grupos de clave
+    natural a borrar de la tabla y `reload_days` los date_id que se borran enteros.
+    """
+
+    def __init__(self, facts, delete_keys, reload_days, days, entries, counts):
+        self.facts = facts
+        self.delete_keys = delete_keys
+        self.reload_days = reload_days
+        self.days = days
+        self.entries = entries
+        self.counts = counts
+
+
+class ChangeIndex:
+    def __init__(self, path=INDEX_PATH, table='fact_flights'):
+        self.path = path
+        self.table = table
+        self.arrays = _empty_entries()
+        if os.path.exists(path):
+            with np.load(path, allow_pickle=False) as stored:
+                if str(stored['table']) == table:
+                    self.arrays = {name: stored[name] for name in self.arrays}
+                    print(f"[changes] index {path}: {len(self.arrays['group'])} fact rows")
+                else:
+                    print(f"[changes] {path} indexes {stored['table']}, not {table}: starting empty")
+
+    def save(self):
+        tmp = self.path + '.tmp.npz'
+        np.savez(tmp, table=np.array(self.table), **self.arrays)
+        os.replace(tmp, self.path)
+
+    def day_counts(self, days):
+        stored = self.arrays['date_id']
+        stored = stored[np.isin(stored, days)]
+        uniq, counts = np.unique(stored, return_counts=True)
+        return dict(zip(uniq.tolist(), counts.tolist()))
+
+    def verify(self, engine, days):
+        """date_id de `days` cuyo numero de filas en la tabla no es el del indice."""
+        days = [int(d) for d in days if d != np.iinfo('int32').min]
+        if not days:
+            return np.array([], dtype='int32')
+        stored = pd.read_sql(f"SELECT date_id, COUNT(*) AS n FROM {self.table} "
+                             f"WHERE date_id IN ({', '.join(map(str, days))}) GROUP BY date_id", con=engine)
+        in_table = dict(zip(stored['date_id'].astype('int64').tolist(), stored['n'].astype('int64').tolist()))
+        indexed = self.day_counts(days)
+        return np.array([d for d in days if in_table.get(d, 0) != indexed.get(d, 0)], dtype='int32')
+
+    def diff(self, engine, facts):
+        """Compara los hechos preparados de una entrega con el indice y devuelve un ChangeSet."""
+        new = _entries(facts)
+        days = np.unique(new['date_id'])
+        reload_days = self.verify(engine, days)
+        old = _select(self.arrays, np.isin(self.arrays['date_id'], days))
+
+        new_keys, old_keys = _entry_keys(new), _entry_keys(old)
+        pos = pd.Index(old_keys).get_indexer(new_keys)
+        added = pos < 0
+        changed = np.zeros(len(new_keys), dtype=bool)
+        if len(old_keys):
+            changed = ~added & (old['row_hash'][np.maximum(pos, 0)] != new['row_hash'])
+        vanished = pd.Index(new_keys).get_indexer(old_keys) < 0
+        dirty = np.union1d(new['group'][added | changed], old['group'][vanished])
+
+        insert = np.isin(new['group'], dirty) | np.isin(new['date_id'], reload_days)
+        delete = np.isin(old['group'], dirty) & ~np.isin(old['date_id'], reload_days)
+        delete_keys = pd.DataFrame(_select({c: old[c] for c in KEY_COLUMNS + ['group']}, delete))
+        delete_keys = delete_keys.drop_duplicates('group').drop(columns='group')
+
+        counts = {'rows': len(facts), 'days': len(days), 'new': int(added.sum()), 'changed': int(changed.sum()),
+                  'vanished': int(vanished.sum()), 'insert': int(insert.sum()), 'delete_groups': len(delete_keys),
+                  'reload_days': len(reload_days)}
+        print(f"[changes] {counts['rows']} rows for {counts['days']} days: {counts['new']} new, "
+              f"{counts['changed']} changed, {counts['vanished']} gone -> insert {counts['insert']} rows, "
+              f"delete {counts['delete_groups']} key groups, {counts['reload_days']} days reloaded in full "
+              f"(row count differs from the index)")
+        return ChangeSet(facts[insert], delete_keys, reload_days, days, new, counts)
+
+    def commit(self, changes):
+        """Sustituye en el indice los dias de la entrega por sus filas y lo guarda (despues de cargarlas)."""
+        keep = ~np.isin(self.arrays['date_id'], changes.days)
+        self.arrays = {name: np.concatenate([values[keep], changes.entries[name]])
+                       for name, values in self.arrays.items()}
+        self.save()
+
+
+def _param(col, value, compact):
+    if value == np.iinfo(KEY_DTYPES[col]).min:
+        return None
+    if col == 'scheduled_departure' and not compact:
+        return datetime.timedelta(minutes=int(value))
+    return int(value)
+
+
+def apply_deletes(engine, changes, table='fact_flights', compact=False):
+    """
+    Borra de `table` los dias de reload_days y los grupos de delete_keys (comparacion NULL-safe) en una
+    transaccion. Devuelve las filas borradas.
+    """
+    same = '<=>' if engine.dialect.name == 'mysql' else 'IS'
+    deleted = 0
+    with engine.begin() as conn:
+        for day in changes.reload_days.tolist():
+            deleted += conn.execute(text(f"DELETE FROM {table} WHERE date_id = :day"), {'day': day}).rowcount
+        rows = changes.delete_keys.to_dict('list')
+        n = len(changes.delete_keys)
+        for start in range(0, n, DELETE_GROUPS_PER_STATEMENT):
+            conditions = []
+            params = {}
+            for i in range(start, min(start + DELETE_GROUPS_PER_STATEMENT, n)):
+                parts = []
+                for j, col in enumerate(KEY_COLUMNS):
+                    params[f"k{i}_{j}"] = _param(col, rows[col][i], compact)
+                    parts.append(f"{col} {same} :k{i}_{j}")
+                conditions.append('(' + ' AND '.join(parts) + ')')
+            deleted += conn.execute(text(f"DELETE FROM {table} WHERE " + ' OR '.join(conditions)), params).rowcount
+    print(f"[changes] {deleted} fact rows deleted from {table}")
+    return deleted
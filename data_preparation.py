@@ -4,6 +4,62 @@ import time as _time
 import numpy as np
 
 
+# Esquema de lectura de flights.csv: solo las columnas que usan prepare_flight_data y las dimensiones,
+# con enteros estrechos, float32 para las columnas con nulos y categorias para los codigos.
+FLIGHTS_CSV_DTYPES = {
+    'YEAR': 'int16',
+    'MONTH': 'int8',
+    'DAY': 'int8',
+    'DAY_OF_WEEK': 'int8',
+    'AIRLINE': 'category',
+    'FLIGHT_NUMBER': 'int32',
+    'TAIL_NUMBER': 'category',
+    'ORIGIN_AIRPORT': 'category',
+    'DESTINATION_AIRPORT': 'category',
+    'SCHEDULED_DEPARTURE': 'float32',
+    'DEPARTURE_TIME': 'float32',
+    'DEPARTURE_DELAY': 'float32',
+    'TAXI_OUT': 'float32',
+    'WHEELS_OFF': 'float32',
+    'SCHEDULED_TIME': 'float32',
+    'ELAPSED_TIME': 'float32',
+    'AIR_TIME': 'float32',
+    'DISTANCE': 'float32',
+    'WHEELS_ON': 'float32',
+    'TAXI_IN': 'float32',
+    'SCHEDULED_ARRIVAL': 'float32',
+    'ARRIVAL_TIME': 'float32',
+    'ARRIVAL_DELAY': 'float32',
+    'DIVERTED': 'int8',
+    'CANCELLED': 'int8',
+    'CANCELLATION_REASON': 'category',
+}
+
+def read_flights_csv(path, chunksize=None, usecols=None, engine='c'):
+    """
+    Lee flights.csv con FLIGHTS_CSV_DTYPES. `usecols` restringe aun mas las columnas (p.ej. solo las
+    de las dimensiones). engine='pyarrow' usa el parser de pyarrow si esta instalado; no admite chunksize,
+    en ese caso (o sin pyarrow) se usa el parser C.
+    """
+    wanted = set(usecols) if usecols is not None else set(FLIGHTS_CSV_DTYPES)
+    if engine == 'pyarrow':
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            print("[read_flights_csv] pyarrow no esta instalado, se usa el parser C")
+            engine = 'c'
+        if chunksize:
+            engine = 'c'
+    columns = lambda c: c in wanted
+    if engine == 'pyarrow':
+        # el parser de pyarrow no admite usecols como funcion: lista explicita a partir de la cabecera
+        columns = [c for c in pd.read_csv(path, nrows=0).columns if c in wanted]
+        wanted = set(columns)
+    return pd.read_csv(path, usecols=columns,
+                       dtype={c: t for c, t in FLIGHTS_CSV_DTYPES.items() if c in wanted},
+                       chunksize=chunksize, engine=engine)
+
+
 def prepare_airline_data(airlines_data):
     airlines_data = airlines_data.rename(
         columns={
@@ -51,21 +107,189 @@ def prepare_cancellation_data(flights_data):
 
     return new_cancellation_data
 
+class DimensionCollector:
+    """
+    Miembros distintos de las dimensiones date y cancellation_reason en una sola pasada por los datos
+    (o bloque a bloque en streaming con update()), en orden de primera aparicion y con las columnas de
+    prepare_date_data / prepare_cancellation_data.
+    Las fechas se comparan como enteros yyyymmdd y solo se mira la primera fila de cada racha de fechas
+    iguales (flights.csv viene ordenado por fecha), sin copias del frame completo.
+    """
+    DAYS = {1: 'Monday', 2: 'Tuesday', 3: 'Wednesday', 4: 'Thursday', 5: 'Friday', 6: 'Saturday', 7: 'Sunday'}
+
+    def __init__(self):
+        self.dates = {}          # yyyymmdd -> DAY_OF_WEEK de la primera aparicion
+        self.cancellations = {}  # codigo -> None (dict como conjunto ordenado)
+
+    def update(self, flights_data):
+        parts = [flights_data[c] for c in ('YEAR', 'MONTH', 'DAY')]
+        if all(isinstance(p.dtype, np.dtype) and p.dtype.kind in 'iu' for p in parts):
+            keys = (parts[0].to_numpy().astype('int64') * 10000 + parts[1].to_numpy().astype('int64') * 100
+                    + parts[2].to_numpy())
+        else:
+            keys = _encode_date_keys(*parts)
+        if len(keys):
+            starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+            uniq, first = np.unique(keys[starts], return_index=True)
+            order = np.argsort(first)
+            dow = flights_data['DAY_OF_WEEK'].to_numpy()[starts[first[order]]]
+            for key, day_of_week in zip(uniq[order].tolist(), dow.tolist()):
+                if key >= 0:
+                    self.dates.setdefault(key, day_of_week)
+        for code in pd.unique(flights_data['CANCELLATION_REASON']):
+            if not pd.isna(code):
+                self.cancellations.setdefault(code, None)
+        return self
+
+    def date_data(self, full_range=False):
+        """Dimension date; con full_range=True, todos los dias entre la primera y la ultima fecha vistas."""
+        keys = np.fromiter(self.dates, dtype='int64', count=len(self.dates))
+        if full_range and len(keys):
+            days = pd.date_range(pd.to_datetime(str(keys.min()), format='%Y%m%d'),
+                                 pd.to_datetime(str(keys.max()), format='%Y%m%d'), freq='D')
+            keys = (days.year * 10000 + days.month * 100 + days.day).to_numpy(dtype='int64')
+            day_of_week = days.dayofweek.to_numpy() + 1
+        else:
+            day_of_week = list(self.dates.values())
+        return pd.DataFrame({
+            'year': keys // 10000,
+            'month': keys // 100 % 100,
+            'day': keys % 100,
+            'day_of_week': pd.Series(day_of_week, dtype=object).map(self.DAYS),
+        })
+
+    def cancellation_data(self):
+        return pd.DataFrame({'cancellation_type': pd.Series(list(self.cancellations), dtype=object)})
+
+def extract_dimension_data(flights_data, full_date_range=False):
+    """(date_data, cancellation_data) de flights_data en una sola pasada (ver DimensionCollector)."""
+    collector = DimensionCollector().update(flights_data)
+    return collector.date_data(full_range=full_date_range), collector.cancellation_data()
+
+def select_incremental_days(flights_data, watermark, redeliver_days=()):
+    """
+    Filas de flights_data de los dias (yyyymmdd) posteriores al watermark o re-entregados.
+    Las filas sin fecha valida se descartan.
+    """
+    keys = _encode_date_keys(flights_data['YEAR'], flights_data['MONTH'], flights_data['DAY'])
+    mask = (keys > watermark) | np.isin(keys, list(redeliver_days))
+    return flights_data[mask]
+
 def _log(msg):
     print(f"[prepare_flight_data] {msg}")
 
 def _format_time_series(ser):
+    """
+    Convierte valores hhmm (930 -> 09:30:00, 2400 -> 24:00:00) a timedelta64 con aritmetica entera
+    (horas = v // 100, minutos = v % 100), sin pasar por strings.
+    Igual que la version anterior con regex + zfill, un valor vacio/NaN se escribe como 00:00:00.
+    """
+    v = pd.to_numeric(ser, errors='coerce').to_numpy(dtype='float64', na_value=np.nan)
+    v = np.nan_to_num(v, nan=0.0)
+    seconds = (v // 100) * 3600 + (v % 100) * 60
+    return pd.Series(pd.to_timedelta(seconds, unit='s'), index=ser.index)
+
+def _encode_date_keys(year, month, day):
+    """year*10000 + month*100 + day como int64; -1 si alguna parte falta o no es entera."""
+    parts = [pd.to_numeric(c, errors='coerce').to_numpy(dtype='float64', na_value=np.nan) for c in (year, month, day)]
+    key = parts[0] * 10000 + parts[1] * 100 + parts[2]
+    valid = ~np.isnan(key)
+    for p in parts:
+        valid &= (p == np.floor(p))
+    return np.where(valid, np.nan_to_num(key), -1).astype('int64')
+
+def _normalize_codes(values):
+    """Misma normalizacion que se aplicaba fila a fila: primer bloque alfanumerico en mayusculas."""
+    return pd.Series(values).astype(str).str.extract(r'([A-Za-z0-9]+)', expand=False).fillna('').str.upper()
+
+def _ids_series(ids, index):
+    # como Series.map(dict): int64 si todo se ha resuelto, float64 con NaN si no
+    if not np.isnan(ids).any():
+        ids = ids.astype('int64')
+    return pd.Series(ids, index=index)
+
+class DimensionLookup:
+    """
+    Resuelve las claves subrogadas de las dimensiones para prepare_flight_data.
+    - Fechas: clave entera year*10000+month*100+day y searchsorted sobre las claves ordenadas de date_db.
+    - Codigos (aeropuerto, aerolinea, cancelacion): la columna se factoriza y la normalizacion (regex,
+      upper) y el mapeo se hacen solo sobre los valores distintos; despues se indexa con los codigos.
+    Los valores sin mapear quedan como NaN, igual que con Series.map.
+    Se construye una vez y se puede reutilizar para varios bloques de flights.
+    """
 
-    s = ser.astype(str).str.extract(r'(\d{1,4})', expand=False).fillna('')
-    s = s.str.zfill(4)  # '5'->'0005', '930'->'0930'
-    s = s.where(s != '', pd.NA)
-
-    formatted = pd.Series(pd.NA, index=ser.index, dtype="object")
-    mask = s.notna()
-    formatted.loc[mask] = s.loc[mask].str.slice(0,2) + ':' + s.loc[mask].str.slice(2,4) + ':00'
-    return formatted
-
-def prepare_flight_data(flight_data, cancellation_db, date_db, airport_db, airline_db):
+    def __init__(self, cancellation_db, date_db, airport_db, airline_db):
+        self.date_keys = np.empty(0, dtype='int64')
+        self.date_values = np.empty(0, dtype='int64')
+        if {'date_id','year','month','day'}.issubset(date_db.columns):
+            keys = _encode_date_keys(date_db['year'], date_db['month'], date_db['day'])
+            ids = pd.Series(date_db['date_id'].astype(int).to_numpy(), index=keys)
+            # como el dict anterior: ante duplicados gana el ultimo
+            ids = ids[~ids.index.duplicated(keep='last')].sort_index()
+            self.date_keys = ids.index.to_numpy(dtype='int64')
+            self.date_values = ids.to_numpy(dtype='int64')
+        else:
+            _log("WARNING: date_db no contiene date_id/year/month/day")
+
+        self.airport_map = {}
+        if {'iata_code','airport_id'}.issubset(airport_db.columns):
+            self.airport_map = dict(zip(airport_db['iata_code'].astype(str).str.upper().str.strip(),
+                                        airport_db['airport_id'].astype(int)))
+        else:
+            _log("WARNING: airport_db no contiene iata_code/airport_id")
+
+        self.airline_map = {}
+        if {'airline_iata','airline_id'}.issubset(airline_db.columns):
+            self.airline_map = dict(zip(airline_db['airline_iata'].astype(str).str.upper().str.strip(),
+                                        airline_db['airline_id'].astype(int)))
+        else:
+            _log("WARNING: airline_db no contiene airline_iata/airline_id")
+
+        self.cancellation_map = {}
+        if {'cancellation_id','cancellation_type'}.issubset(cancellation_db.columns):
+            self.cancellation_map = dict(zip(cancellation_db['cancellation_type'].astype(str),
+                                             cancellation_db['cancellation_id'].astype(int)))
+        else:
+            _log("WARNING: cancellation_db no contiene cancellation_type/cancellation_id")
+
+    @property
+    def has_dates(self):
+        return len(self.date_keys) > 0
+
+    def date_ids(self, year, month, day):
+        keys = _encode_date_keys(year, month, day)
+        pos = np.searchsorted(self.date_keys, keys)
+        pos_ok = np.minimum(pos, len(self.date_keys) - 1)
+        found = (pos < len(self.date_keys)) & (self.date_keys[pos_ok] == keys)
+        ids = np.where(found, self.date_values[pos_ok], np.nan)
+        return _ids_series(ids, year.index)
+
+    def _code_ids(self, ser, mapping, normalize):
+        if isinstance(ser.dtype, pd.CategoricalDtype):
+            codes = ser.cat.codes.to_numpy()
+            uniques = ser.cat.categories
+        else:
+            codes, uniques = pd.factorize(ser)
+        # ultimo elemento = valor para los nulos (codigo -1); antes un NaN se convertia en el texto 'nan'
+        uniques = list(uniques) + [np.nan]
+        if normalize:
+            keys = _normalize_codes(uniques)
+        else:
+            keys = pd.Series(uniques, dtype=object)
+        uniq_ids = keys.map(mapping).to_numpy(dtype='float64', na_value=np.nan)
+        return _ids_series(uniq_ids[codes], ser.index)
+
+    def airport_ids(self, ser):
+        return self._code_ids(ser, self.airport_map, normalize=True)
+
+    def airline_ids(self, ser):
+        return self._code_ids(ser, self.airline_map, normalize=True)
+
+    def cancellation_ids(self, ser):
+        return self._code_ids(ser, self.cancellation_map, normalize=False)
+
+def prepare_flight_data(flight_data, cancellation_db, date_db, airport_db, airline_db, lookup=None,
+                        null_summary=True):
     t0 = _time.time()
     _log("start (no-merge version)")
 
@@ -86,61 +310,33 @@ def prepare_flight_data(flight_data, cancellation_db, date_db, airport_db, airli
     _log(f"time cols formatted in {_time.time()-t0:.2f}s")
 
 
-    date_map = {}
-    if {'date_id','year','month','day'}.issubset(date_db.columns):
-
-        date_map = { f"{int(r.year)}-{int(r.month)}-{int(r.day)}": int(r.date_id)
-                     for _, r in date_db.iterrows() }
-    else:
-        _log("WARNING: date_db no contiene date_id/year/month/day")
+    if lookup is None:
+        lookup = DimensionLookup(cancellation_db, date_db, airport_db, airline_db)
 
-    airport_map = {}
-    if {'iata_code','airport_id'}.issubset(airport_db.columns):
-        airport_map = dict(zip(airport_db['iata_code'].astype(str).str.upper().str.strip(),
-                               airport_db['airport_id'].astype(int)))
-    else:
-        _log("WARNING: airport_db no contiene iata_code/airport_id")
-
-    airline_map = {}
-    if {'airline_iata','airline_id'}.issubset(airline_db.columns):
-        airline_map = dict(zip(airline_db['airline_iata'].astype(str).str.upper().str.strip(),
-                               airline_db['airline_id'].astype(int)))
-    else:
-        _log("WARNING: airline_db no contiene airline_iata/airline_id")
-
-    cancellation_map = {}
-    if {'cancellation_id','cancellation_type'}.issubset(cancellation_db.columns):
-        cancellation_map = dict(zip(cancellation_db['cancellation_type'].astype(str),
-                                    cancellation_db['cancellation_id'].astype(int)))
-    else:
-        _log("WARNING: cancellation_db no contiene cancellation_type/cancellation_id")
-
-
-    if {'YEAR','MONTH','DAY'}.issubset(df.columns) and date_map:
-        date_key = df['YEAR'].astype(str).str.strip() + '-' + df['MONTH'].astype(str).str.strip() + '-' + df['DAY'].astype(str).str.strip()
-        df['date_id'] = date_key.map(date_map)
+    if {'YEAR','MONTH','DAY'}.issubset(df.columns) and lookup.has_dates:
+        df['date_id'] = lookup.date_ids(df['YEAR'], df['MONTH'], df['DAY'])
     else:
         df['date_id'] = pd.NA
     _log(f"date_id mapped in {_time.time()-t0:.2f}s")
 
 
     if 'ORIGIN_AIRPORT' in df.columns:
-        df['origin_airport_id'] = df['ORIGIN_AIRPORT'].astype(str).str.extract(r'([A-Za-z0-9]+)', expand=False).fillna('').str.upper().map(airport_map)
+        df['origin_airport_id'] = lookup.airport_ids(df['ORIGIN_AIRPORT'])
     else:
         df['origin_airport_id'] = pd.NA
 
     if 'DESTINATION_AIRPORT' in df.columns:
-        df['destination_airport_id'] = df['DESTINATION_AIRPORT'].astype(str).str.extract(r'([A-Za-z0-9]+)', expand=False).fillna('').str.upper().map(airport_map)
+        df['destination_airport_id'] = lookup.airport_ids(df['DESTINATION_AIRPORT'])
     else:
         df['destination_airport_id'] = pd.NA
 
     if 'AIRLINE' in df.columns:
-        df['airline_id'] = df['AIRLINE'].astype(str).str.extract(r'([A-Za-z0-9]+)', expand=False).fillna('').str.upper().map(airline_map)
+        df['airline_id'] = lookup.airline_ids(df['AIRLINE'])
     else:
         df['airline_id'] = pd.NA
 
     if 'CANCELLATION_REASON' in df.columns:
-        df['cancellation_id'] = df['CANCELLATION_REASON'].map(cancellation_map)
+        df['cancellation_id'] = lookup.cancellation_ids(df['CANCELLATION_REASON'])
     else:
         df['cancellation_id'] = pd.NA
 
@@ -191,27 +387,206 @@ def prepare_flight_data(flight_data, cancellation_db, date_db, airport_db, airli
     existing_final_cols = [c for c in needed_columns if c in df.columns]
     result = df[existing_final_cols].copy()
 
-    show_null_summary(result, ['scheduled_time','cancellation_id','origin_airport_id','destination_airport_id','air_time','arrival_delay'])
+    if null_summary:
+        show_null_summary(result, ['scheduled_time','cancellation_id','origin_airport_id','destination_airport_id','air_time','arrival_delay'])
     result = drop_missing_scheduled_time(result, save_dropped=True, dropped_path='dropped_missing_scheduled_time.csv')
 
     result = postprocess_cancellations(result, cancellation_db=None, add_unknown=False)
-    show_null_summary(result, ['scheduled_time','cancellation_id','origin_airport_id','destination_airport_id','air_time','arrival_delay'])
+    if null_summary:
+        show_null_summary(result, ['scheduled_time','cancellation_id','origin_airport_id','destination_airport_id','air_time','arrival_delay'])
 
     _log(f"done in {_time.time()-t0:.2f}s, result shape: {result.shape}")
     return result
 
+# Modo compacto (flights_db_compact.sql): las horas son minutos del dia (SMALLINT) y las medidas enteros
+# estrechos; todas las columnas son arrays enteros de numpy y el minimo de cada tipo entero con signo
+# (-32768 en int16) representa NULL.
+COMPACT_FACT_TABLE = 'fact_flights_compact'
+COMPACT_FACT_DTYPES = {
+    'flight_number': 'int16',
+    'airline_id': 'int32',
+    'origin_airport_id': 'int32',
+    'destination_airport_id': 'int32',
+    'date_id': 'int32',
+    'cancellation_id': 'int32',
+    'scheduled_departure': 'int16',
+    'scheduled_time': 'int16',
+    'departure_time': 'int16',
+    'departure_delay': 'int16',
+    'taxi_out': 'int16',
+    'wheels_off': 'int16',
+    'elapsed_time': 'int16',
+    'air_time': 'int16',
+    'distance': 'int16',
+    'wheels_on': 'int16',
+    'taxi_in': 'int16',
+    'scheduled_arrival': 'int16',
+    'arrival_time': 'int16',
+    'arrival_delay': 'int16',
+    'is_diverted': 'int8',
+    'is_cancelled': 'int8',
+}
+
+def null_mask(ser):
+    """Nulos de una columna de hechos: NaN/NA/NaT y, en columnas enteras con signo de numpy, el minimo del tipo."""
+    dtype = ser.dtype
+    if isinstance(dtype, np.dtype) and dtype.kind == 'i':
+        return ser.to_numpy() == np.iinfo(dtype).min
+    return ser.isna().to_numpy()
+
+def expand_compact_nulls(df):
+    """Copia de df con las columnas enteras que tienen el valor centinela como float64 con NaN."""
+    changed = {}
+    for col in df.columns:
+        dtype = df[col].dtype
+        if isinstance(dtype, np.dtype) and dtype.kind == 'i':
+            null = null_mask(df[col])
+            if null.any():
+                changed[col] = np.where(null, np.nan, df[col].to_numpy(dtype='float64'))
+    return df.assign(**changed) if changed else df
+
+def _compact_ints(values, dtype, name):
+    """float -> entero numpy redondeando como MySQL (half away from zero); NaN y fuera de rango -> centinela."""
+    info = np.iinfo(dtype)
+    f = pd.to_numeric(pd.Series(values), errors='coerce').to_numpy(dtype='float64', na_value=np.nan)
+    r = np.sign(f) * np.floor(np.abs(f) + 0.5)
+    out_of_range = (r <= info.min) | (r > info.max)
+    if out_of_range.any():
+        _log(f"WARNING: {int(out_of_range.sum())} values of {name} do not fit in {dtype}, stored as NULL")
+    return np.where(np.isnan(r) | out_of_range, info.min, np.nan_to_num(r)).astype(dtype)
+
+def _minutes_of_day(values):
+    """hhmm -> minutos del dia (930 -> 570, 2400 -> 1440); vacio/NaN -> 0, como _format_time_series."""
+    v = pd.to_numeric(values, errors='coerce').to_numpy(dtype='float64', na_value=np.nan)
+    v = np.nan_to_num(v, nan=0.0)
+    return ((v // 100) * 60 + v % 100).astype('int16')
+
+def prepare_flight_data_compact(flight_data, cancellation_db, date_db, airport_db, airline_db, lookup=None,
+                                null_summary=True):
+    """
+    Igual que prepare_flight_data pero para fact_flights_compact: sin timedelta, Float32/Int32 ni strings,
+    cada columna es un array entero de numpy (COMPACT_FACT_DTYPES, aircraft_id sigue siendo categoria).
+    Mismas filas y mismos valores: se quitan las filas sin SCHEDULED_TIME y cancellation_id es NULL en
+    los vuelos no cancelados.
+    """
+    t0 = _time.time()
+    _log("start (compact)")
+    if lookup is None:
+        lookup = DimensionLookup(cancellation_db, date_db, airport_db, airline_db)
+
+    missing = pd.to_numeric(flight_data['SCHEDULED_TIME'], errors='coerce').isna().to_numpy()
+    print(f"[drop_missing_scheduled_time] total rows before = {len(flight_data)}, "
+          f"missing scheduled_time = {int(missing.sum())}")
+    df = flight_data[~missing] if missing.any() else flight_data
+
+    is_cancelled = pd.to_numeric(df['CANCELLED'], errors='coerce').fillna(0).to_numpy().astype('int8')
+    cancellation_ids = lookup.cancellation_ids(df['CANCELLATION_REASON']).to_numpy(dtype='float64')
+    cancellation_ids[is_cancelled == 0] = np.nan
+
+    result = pd.DataFrame({
+        'flight_number': _compact_ints(df['FLIGHT_NUMBER'], 'int16', 'flight_number'),
+        'aircraft_id': df['TAIL_NUMBER'],
+        'airline_id': _compact_ints(lookup.airline_ids(df['AIRLINE']), 'int32', 'airline_id'),
+        'origin_airport_id': _compact_ints(lookup.airport_ids(df['ORIGIN_AIRPORT']), 'int32', 'origin_airport_id'),
+        'destination_airport_id': _compact_ints(lookup.airport_ids(df['DESTINATION_AIRPORT']), 'int32',
+                                                'destination_airport_id'),
+        'date_id': _compact_ints(lookup.date_ids(df['YEAR'], df['MONTH'], df['DAY']), 'int32', 'date_id'),
+        'cancellation_id': _compact_ints(cancellation_ids, 'int32', 'cancellation_id'),
+    }, index=df.index)
+    _log(f"dimension ids mapped in {_time.time()-t0:.2f}s")
+
+    sources = {
+        'scheduled_departure': 'SCHEDULED_DEPARTURE', 'scheduled_time': 'SCHEDULED_TIME',
+        'departure_time': 'DEPARTURE_TIME', 'departure_delay': 'DEPARTURE_DELAY', 'taxi_out': 'TAXI_OUT',
+        'wheels_off': 'WHEELS_OFF', 'elapsed_time': 'ELAPSED_TIME', 'air_time': 'AIR_TIME',
+        'distance': 'DISTANCE', 'wheels_on': 'WHEELS_ON', 'taxi_in': 'TAXI_IN',
+        'scheduled_arrival': 'SCHEDULED_ARRIVAL', 'arrival_time': 'ARRIVAL_TIME', 'arrival_delay': 'ARRIVAL_DELAY',
+    }
+    time_columns = ['scheduled_departure', 'departure_time', 'wheels_off', 'wheels_on', 'scheduled_arrival',
+                    'arrival_time']
+    for col, source in sources.items():
+        if col in time_columns:
+            result[col] = _minutes_of_day(df[source])
+        else:
+            result[col] = _compact_ints(df[source], COMPACT_FACT_DTYPES[col], col)
+    result['is_diverted'] = pd.to_numeric(df['DIVERTED'], errors='coerce').fillna(0).to_numpy().astype('int8')
+    result['is_cancelled'] = is_cancelled
+
+    if null_summary:
+        cols = ['scheduled_time', 'cancellation_id', 'origin_airport_id', 'destination_airport_id', 'air_time',
+                'arrival_delay']
+        show_null_summary(expand_compact_nulls(result[cols]), cols)
+    _log(f"done in {_time.time()-t0:.2f}s, result shape: {result.shape}")
+    return result
+
+# Estado de cada proceso del pool de prepare_flight_data_parallel (se envia una vez por proceso)
+_worker_dims = None
+_worker_lookup = None
+
+def _init_prepare_worker(cancellation_db, date_db, airport_db, airline_db):
+    global _worker_dims, _worker_lookup
+    _worker_dims = (cancellation_db, date_db, airport_db, airline_db)
+    _worker_lookup = DimensionLookup(cancellation_db, date_db, airport_db, airline_db)
+
+def _prepare_partition(part, null_summary=True, compact=False):
+    prepare = prepare_flight_data_compact if compact else prepare_flight_data
+    return prepare(part, *_worker_dims, lookup=_worker_lookup, null_summary=null_summary)
+
+def _row_partitions(flight_data, partition_rows, by_month=False):
+    """
+    Trozos contiguos de flight_data (el orden de filas se conserva al concatenarlos).
+    by_month=True corta donde cambia (YEAR, MONTH) y ademas cada `partition_rows` filas.
+    """
+    n = len(flight_data)
+    cuts = set(range(0, n, max(partition_rows, 1)))
+    if by_month and n > 0:
+        key = (pd.to_numeric(flight_data['YEAR']).to_numpy(dtype='int64') * 100 +
+               pd.to_numeric(flight_data['MONTH']).to_numpy(dtype='int64'))
+        cuts.update((np.flatnonzero(key[1:] != key[:-1]) + 1).tolist())
+    bounds = sorted(cuts) + [n]
+    return [flight_data.iloc[a:b] for a, b in zip(bounds[:-1], bounds[1:]) if b > a]
+
+def prepare_flight_data_parallel(flight_data, cancellation_db, date_db, airport_db, airline_db,
+                                 workers=None, partition_rows=500000, by_month=False, null_summary=True,
+                                 compact=False):
+    """
+    prepare_flight_data en un pool de procesos: flight_data se divide en particiones contiguas
+    (cada `partition_rows` filas y, con by_month=True, tambien por mes), cada proceso recibe las
+    dimensiones una sola vez al arrancar y los resultados se concatenan en el orden original.
+    El resultado es el mismo DataFrame que el de prepare_flight_data (prepare_flight_data_compact con
+    compact=True).
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    from functools import partial
+
+    t0 = _time.time()
+    parts = _row_partitions(flight_data, partition_rows, by_month)
+    if len(parts) <= 1 or workers == 1:
+        prepare = prepare_flight_data_compact if compact else prepare_flight_data
+        return prepare(flight_data, cancellation_db, date_db, airport_db, airline_db, null_summary=null_summary)
+
+    _log(f"parallel: {len(parts)} partitions, {workers or 'cpu_count'} workers")
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_prepare_worker,
+                             initargs=(cancellation_db, date_db, airport_db, airline_db)) as pool:
+        results = list(pool.map(partial(_prepare_partition, null_summary=null_summary, compact=compact), parts))
+
+    result = pd.concat(results)
+    _log(f"parallel done in {_time.time()-t0:.2f}s, result shape: {result.shape}")
+    return result
+
+
 def drop_missing_scheduled_time(df, save_dropped=True, dropped_path='dropped_missing_scheduled_time.csv'):
   
     import os
     total = len(df)
     if 'scheduled_time' not in df.columns:
-        return df.copy()
+        return df
 
     missing = df['scheduled_time'].isna().sum()
     print(f"[drop_missing_scheduled_time] total rows before = {total}, missing scheduled_time = {missing}")
 
     if missing == 0:
-        return df.copy()
+        return df
 
    
     kept_df = df[df['scheduled_time'].notna()].copy()
@@ -25,12 +25,27 @@ CREATE TABLE IF NOT EXISTS date (
   year INT,
   month INT,
   day INT,
-  day_of_week VARCHAR(20)
+  day_of_week VARCHAR(20),
+  UNIQUE (year, month, day)
 ) ENGINE=InnoDB;
 
 CREATE TABLE IF NOT EXISTS cancellation_reason (
   cancellation_id INT AUTO_INCREMENT PRIMARY KEY,
-  cancellation_type VARCHAR(100)
+  cancellation_type VARCHAR(100) UNIQUE
+) ENGINE=InnoDB;
+
+-- Rutas (origen, destino) vistas en los hechos (main.py --routes, routes.py): distancia ortodromica en
+-- millas calculada con las coordenadas de airport y rango de DISTANCE informado al crear la ruta
+CREATE TABLE IF NOT EXISTS route (
+  route_id INT AUTO_INCREMENT PRIMARY KEY,
+  origin_airport_id INT NOT NULL,
+  destination_airport_id INT NOT NULL,
+  great_circle_distance DOUBLE,
+  reported_distance_min INT,
+  reported_distance_max INT,
+  UNIQUE (origin_airport_id, destination_airport_id),
+  foreign key(origin_airport_id) references airport(airport_id),
+  foreign key(destination_airport_id) references airport(airport_id)
 ) ENGINE=InnoDB;
 
 -- Tabla de hechos (fact_flights) con las columnas que el script Python escribe (df_db)
@@ -59,10 +74,86 @@ CREATE TABLE IF NOT EXISTS fact_flights (
   arrival_delay INT,
   is_diverted BOOL,
   is_cancelled BOOL,
+  route_id INT,
   
   foreign key(airline_id) references airline(airline_id),
   foreign key(origin_airport_id) references airport(airport_id),
   foreign key(destination_airport_id) references airport(airport_id),
   foreign key(date_id) references date(date_id),
-  foreign key(cancellation_id) references cancellation_reason(cancellation_id)
+  foreign key(cancellation_id) references cancellation_reason(cancellation_id),
+  foreign key(route_id) references route(route_id)
+) ENGINE=InnoDB;
+
+-- Estado del ETL: fact_watermark = ultimo dia (yyyymmdd) cargado en modo incremental,
+-- bulk_load_dropped = indices/FK de fact_flights quitados por una carga masiva (bulk_load.py)
+CREATE TABLE IF NOT EXISTS etl_state (
+  state_key VARCHAR(64) PRIMARY KEY,
+  state_value TEXT,
+  updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+) ENGINE=InnoDB;
+
+-- Agregados de fact_flights que construye el ETL (--aggregates, aggregates.py). Las filas de los dias y
+-- meses cargados se sustituyen en cada carga; `python aggregates.py rebuild` los recalcula desde
+-- fact_flights. Retrasos en minutos: *_sum y *_flights permiten medias de cualquier periodo,
+-- arr_delay_p50/p90 son percentiles del grupo (no se pueden combinar entre filas).
+CREATE TABLE IF NOT EXISTS agg_daily_airline (
+  date_id INT NOT NULL,
+  airline_id INT NOT NULL,
+  flights INT NOT NULL,
+  cancelled INT NOT NULL,
+  diverted INT NOT NULL,
+  dep_delay_flights INT NOT NULL,
+  dep_delay_sum BIGINT NOT NULL,
+  arr_delay_flights INT NOT NULL,
+  arr_delay_sum BIGINT NOT NULL,
+  arr_delayed_15 INT NOT NULL,
+  arr_delay_p50 DOUBLE,
+  arr_delay_p90 DOUBLE,
+  cancelled_a INT NOT NULL,
+  cancelled_b INT NOT NULL,
+  cancelled_c INT NOT NULL,
+  cancelled_d INT NOT NULL,
+  PRIMARY KEY (date_id, airline_id)
+) ENGINE=InnoDB;
+
+CREATE TABLE IF NOT EXISTS agg_daily_origin (
+  date_id INT NOT NULL,
+  origin_airport_id INT NOT NULL,
+  flights INT NOT NULL,
+  cancelled INT NOT NULL,
+  diverted INT NOT NULL,
+  dep_delay_flights INT NOT NULL,
+  dep_delay_sum BIGINT NOT NULL,
+  arr_delay_flights INT NOT NULL,
+  arr_delay_sum BIGINT NOT NULL,
+  arr_delayed_15 INT NOT NULL,
+  arr_delay_p50 DOUBLE,
+  arr_delay_p90 DOUBLE,
+  cancelled_a INT NOT NULL,
+  cancelled_b INT NOT NULL,
+  cancelled_c INT NOT NULL,
+  cancelled_d INT NOT NULL,
+  PRIMARY KEY (date_id, origin_airport_id)
+) ENGINE=InnoDB;
+
+CREATE TABLE IF NOT EXISTS agg_monthly_route (
+  year INT NOT NULL,
+  month INT NOT NULL,
+  origin_airport_id INT NOT NULL,
+  destination_airport_id INT NOT NULL,
+  flights INT NOT NULL,
+  cancelled INT NOT NULL,
+  diverted INT NOT NULL,
+  dep_delay_flights INT NOT NULL,
+  dep_delay_sum BIGINT NOT NULL,
+  arr_delay_flights INT NOT NULL,
+  arr_delay_sum BIGINT NOT NULL,
+  arr_delayed_15 INT NOT NULL,
+  arr_delay_p50 DOUBLE,
+  arr_delay_p90 DOUBLE,
+  cancelled_a INT NOT NULL,
+  cancelled_b INT NOT NULL,
+  cancelled_c INT NOT NULL,
+  cancelled_d INT NOT NULL,
+  PRIMARY KEY (year, month, origin_airport_id, destination_airport_id)
 ) ENGINE=InnoDB;
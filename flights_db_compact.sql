@@ -0,0 +1,76 @@
+-- Variante compacta de fact_flights (main.py --compact). Se ejecuta despues de flights_db.sql y sustituye
+-- fact_flights (se pierden los hechos cargados).
+-- Los hechos se guardan en fact_flights_compact: las seis horas son SMALLINT con minutos del dia
+-- (09:30 -> 570, 24:00 -> 1440), las medidas SMALLINT y los indicadores TINYINT. La fila ocupa menos en
+-- disco y en el buffer pool y el ETL no construye strings ni timedelta para cargarla.
+-- La vista fact_flights devuelve las mismas columnas y tipos (TIME) que la tabla original, asi que las
+-- consultas existentes (test.py, aggregates.py, quality.py) no cambian. DELETE sobre la vista funciona;
+-- los INSERT van a fact_flights_compact.
+USE flights_db;
+
+DROP TABLE IF EXISTS fact_flights;
+DROP VIEW IF EXISTS fact_flights;
+
+CREATE TABLE IF NOT EXISTS fact_flights_compact (
+  flight_id INT AUTO_INCREMENT PRIMARY KEY,
+  flight_number SMALLINT,
+  aircraft_id VARCHAR(100),
+  airline_id INT,
+  origin_airport_id INT,
+  destination_airport_id INT,
+  date_id INT,
+  cancellation_id INT,
+  scheduled_departure SMALLINT,
+  scheduled_time SMALLINT,
+  departure_time SMALLINT,
+  departure_delay SMALLINT,
+  taxi_out SMALLINT,
+  wheels_off SMALLINT,
+  elapsed_time SMALLINT,
+  air_time SMALLINT,
+  distance SMALLINT,
+  wheels_on SMALLINT,
+  taxi_in SMALLINT,
+  scheduled_arrival SMALLINT,
+  arrival_time SMALLINT,
+  arrival_delay SMALLINT,
+  is_diverted TINYINT,
+  is_cancelled TINYINT,
+  route_id INT,
+
+  foreign key(airline_id) references airline(airline_id),
+  foreign key(origin_airport_id) references airport(airport_id),
+  foreign key(destination_airport_id) references airport(airport_id),
+  foreign key(date_id) references date(date_id),
+  foreign key(cancellation_id) references cancellation_reason(cancellation_id),
+  foreign key(route_id) references route(route_id)
+) ENGINE=InnoDB;
+
+CREATE OR REPLACE VIEW fact_flights AS
+SELECT
+  flight_id,
+  flight_number,
+  aircraft_id,
+  airline_id,
+  origin_airport_id,
+  destination_airport_id,
+  date_id,
+  cancellation_id,
+  SEC_TO_TIME(scheduled_departure * 60) AS scheduled_departure,
+  scheduled_time,
+  SEC_TO_TIME(departure_time * 60) AS departure_time,
+  departure_delay,
+  taxi_out,
+  SEC_TO_TIME(wheels_off * 60) AS wheels_off,
+  elapsed_time,
+  air_time,
+  distance,
+  SEC_TO_TIME(wheels_on * 60) AS wheels_on,
+  taxi_in,
+  SEC_TO_TIME(scheduled_arrival * 60) AS scheduled_arrival,
+  SEC_TO_TIME(arrival_time * 60) AS arrival_time,
+  arrival_delay,
+  is_diverted,
+  is_cancelled,
+  route_id
+FROM fact_flights_compact;
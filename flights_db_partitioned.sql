@@ -0,0 +1,49 @@
+-- Variante de fact_flights particionada por rangos de date_id (una particion por mes).
+-- Se ejecuta despues de flights_db.sql y sustituye fact_flights (se pierden los hechos cargados).
+-- MySQL no admite FOREIGN KEY en tablas particionadas: se dejan indices en las columnas de las
+-- dimensiones y bulk_load.py valida las referencias despues de cada carga masiva.
+-- La clave primaria tiene que incluir date_id (columna de particionado).
+-- Se crea solo pmax; `python bulk_load.py partitions` (o main.py --bulk) la divide en pYYYYMM
+-- a partir de la dimension date y `python bulk_load.py truncate YYYY-MM` vacia un mes.
+USE flights_db;
+
+DROP TABLE IF EXISTS fact_flights;
+
+CREATE TABLE fact_flights (
+  flight_id INT AUTO_INCREMENT,
+  flight_number INT,
+  aircraft_id VARCHAR(100),
+  airline_id INT,
+  origin_airport_id INT,
+  destination_airport_id INT,
+  date_id INT NOT NULL,
+  cancellation_id INT,
+  scheduled_departure TIME,
+  scheduled_time INT,
+  departure_time TIME,
+  departure_delay INT,
+  taxi_out INT,
+  wheels_off TIME,
+  elapsed_time INT,
+  air_time INT,
+  distance INT,
+  wheels_on TIME,
+  taxi_in INT,
+  scheduled_arrival TIME,
+  arrival_time TIME,
+  arrival_delay INT,
+  is_diverted BOOL,
+  is_cancelled BOOL,
+  route_id INT,
+
+  PRIMARY KEY (flight_id, date_id),
+  KEY idx_airline (airline_id),
+  KEY idx_origin_airport (origin_airport_id),
+  KEY idx_destination_airport (destination_airport_id),
+  KEY idx_date (date_id),
+  KEY idx_cancellation (cancellation_id),
+  KEY idx_route (route_id)
+) ENGINE=InnoDB
+PARTITION BY RANGE (date_id) (
+  PARTITION pmax VALUES LESS THAN MAXVALUE
+);
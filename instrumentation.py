@@ -0,0 +1,196 @@
+"""
+instrumentation.py
+Metricas estructuradas del ETL: tiempo, filas, filas/s y variacion de memoria por etapa, mas un
+histograma de latencias de los lotes de INSERT. Las metricas se escriben en un fichero JSON-lines
+y se imprime un resumen al final.
+Desactivado por defecto: stage()/call()/observe_batch() no hacen casi nada hasta llamar a configure().
+"""
+
+import json
+import os
+import platform
+import threading
+import time
+from collections import OrderedDict
+
+# Limites superiores (ms) de los buckets del histograma de latencias de lotes
+LATENCY_BUCKETS_MS = [5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, float('inf')]
+
+
+def current_rss():
+    """RSS actual del proceso en bytes (Linux: /proc/self/statm; si no, el pico de getrusage)."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        try:
+            import resource
+        except ImportError:
+            return 0
+        scale = 1 if platform.system() == 'Darwin' else 1024
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+
+class _NullStage:
+    """Etapa que no mide nada (instrumentacion desactivada)."""
+    rows = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage:
+    def __init__(self, metrics, name, rows):
+        self.metrics = metrics
+        self.name = name
+        self.rows = rows
+
+    def __enter__(self):
+        self.rss0 = current_rss()
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        wall = time.perf_counter() - self.t0
+        self.metrics._record_stage(self.name, wall, self.rows, current_rss() - self.rss0,
+                                   'error' if exc_type else 'ok')
+        return False
+
+
+class _Histogram:
+    def __init__(self):
+        self.counts = [0] * len(LATENCY_BUCKETS_MS)
+        self.n = 0
+        self.rows = 0
+        self.total = 0.0
+        self.min = float('inf')
+        self.max = 0.0
+
+    def add(self, seconds, rows):
+        ms = seconds * 1000
+        for i, bound in enumerate(LATENCY_BUCKETS_MS):
+            if ms <= bound:
+                self.counts[i] += 1
+                break
+        self.n += 1
+        self.rows += rows
+        self.total += seconds
+        self.min = min(self.min, seconds)
+        self.max = max(self.max, seconds)
+
+    def quantile(self, q):
+        """Aproximacion por el limite superior del bucket que contiene el cuantil q."""
+        target = q * self.n
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS_MS, self.counts):
+            seen += count
+            if seen >= target and count:
+                return round(min(bound, self.max * 1000), 2)
+        return round(self.max * 1000, 2)
+
+    def as_dict(self):
+        return {
+            'batches': self.n, 'rows': self.rows, 'total_s': round(self.total, 4),
+            'min_ms': round(self.min * 1000, 2) if self.n else None, 'max_ms': round(self.max * 1000, 2),
+            'mean_ms': round(self.total / self.n * 1000, 2) if self.n else None,
+            'p50_ms': self.quantile(0.5), 'p90_ms': self.quantile(0.9), 'p99_ms': self.quantile(0.99),
+            'buckets_ms': {('inf' if b == float('inf') else str(b)): c
+                           for b, c in zip(LATENCY_BUCKETS_MS, self.counts)},
+        }
+
+
+class Metrics:
+    def __init__(self):
+        self.enabled = False
+        self.path = None
+        self._file = None
+        self._lock = threading.Lock()
+        self.stages = OrderedDict()
+        self.batches = OrderedDict()
+
+    def configure(self, path):
+        """Activa la instrumentacion escribiendo JSON-lines en `path`."""
+        self.enabled = True
+        self.path = path
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def _emit(self, record):
+        record['ts'] = time.time()
+        with self._lock:
+            self._file.write(json.dumps(record) + '\n')
+
+    def _record_stage(self, name, wall, rows, rss_delta, status):
+        record = {'type': 'stage', 'name': name, 'wall_s': round(wall, 4), 'rows': rows,
+                  'rows_per_s': round(rows / wall, 1) if rows and wall > 0 else None,
+                  'rss_delta_mb': round(rss_delta / 2**20, 2), 'status': status}
+        self._emit(record)
+        with self._lock:
+            agg = self.stages.setdefault(name, {'calls': 0, 'wall_s': 0.0, 'rows': 0, 'rss_delta_mb': 0.0})
+            agg['calls'] += 1
+            agg['wall_s'] += wall
+            agg['rows'] += rows or 0
+            agg['rss_delta_mb'] += rss_delta / 2**20
+
+    def stage(self, name, rows=None):
+        """
+        Context manager que mide una etapa. Las filas se pueden fijar despues con `st.rows = n`:
+            with metrics.stage('read_csv:flights') as st:
+                df = ...
+                st.rows = len(df)
+        """
+        if not self.enabled:
+            return _NULL_STAGE
+        return _Stage(self, name, rows)
+
+    def call(self, name, fn, *args, rows=None, **kwargs):
+        """Ejecuta fn(*args, **kwargs) como etapa `name`; sin `rows`, usa len() del resultado si es un DataFrame."""
+        if not self.enabled:
+            return fn(*args, **kwargs)
+        with self.stage(name, rows) as st:
+            value = fn(*args, **kwargs)
+            if st.rows is None and hasattr(value, 'shape'):
+                st.rows = len(value)
+        return value
+
+    def observe_batch(self, name, rows, seconds):
+        """Registra un lote de INSERT (filas y latencia) en el histograma de `name`."""
+        if not self.enabled:
+            return
+        self._emit({'type': 'batch', 'name': name, 'rows': rows, 'seconds': round(seconds, 5)})
+        with self._lock:
+            self.batches.setdefault(name, _Histogram()).add(seconds, rows)
+
+    def summary(self):
+        """Imprime el resumen por etapa y de latencias, y lo anade al fichero JSON-lines."""
+        if not self.enabled:
+            return None
+        print("\n===== ETL metrics summary =====")
+        for name, agg in self.stages.items():
+            rate = agg['rows'] / agg['wall_s'] if agg['rows'] and agg['wall_s'] > 0 else 0
+            print(f"{name:<40} {agg['calls']:>4}x {agg['wall_s']:>9.2f}s {agg['rows']:>11} rows "
+                  f"{rate:>11.0f} rows/s  mem {agg['rss_delta_mb']:+.1f} MB")
+        batches = {name: h.as_dict() for name, h in self.batches.items()}
+        for name, h in batches.items():
+            print(f"{name} batches: {h['batches']} ({h['rows']} rows), latency ms "
+                  f"min {h['min_ms']} p50<={h['p50_ms']} p90<={h['p90_ms']} p99<={h['p99_ms']} max {h['max_ms']}")
+        summary = {'type': 'summary', 'stages': {k: dict(v) for k, v in self.stages.items()}, 'batches': batches}
+        self._emit(summary)
+        self._file.flush()
+        print(f"Metrics written to {self.path}")
+        return summary
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self.enabled = False
+
+
+# Instancia global usada por main.py
+metrics = Metrics()
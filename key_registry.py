@@ -0,0 +1,100 @@
+"""
+key_registry.py
+Registro de claves subrogadas de las dimensiones asignadas en el cliente.
+En lugar de insertar las dimensiones y leerlas otra vez para conocer sus AUTO_INCREMENT, el ETL
+asigna el id de cada clave natural nueva (max + 1, en orden de clave para que sea determinista) y
+carga las dimensiones con id explicito. Asi prepare_flight_data no tiene que esperar a que las
+dimensiones esten cargadas.
+El registro se guarda en un fichero JSON y al empezar se sincroniza con las filas que ya hay en la
+base de datos (la base de datos manda): los ids se mantienen entre ejecuciones y con la BD.
+No esta pensado para dos ETL escribiendo a la vez en la misma base de datos.
+"""
+
+import json
+import os
+
+import pandas as pd
+
+# tabla -> (columna id, columnas de la clave natural)
+DIMENSIONS = {
+    'airline': ('airline_id', ['airline_iata']),
+    'airport': ('airport_id', ['iata_code']),
+    'date': ('date_id', ['year', 'month', 'day']),
+    'cancellation_reason': ('cancellation_id', ['cancellation_type']),
+}
+
+REGISTRY_PATH = os.path.join("Data", ".key_registry.json")
+
+
+def _key_tuples(frame, keys):
+    # astype(object) -> int/str de Python, que se pueden comparar con lo leido del JSON
+    return list(frame[keys].astype(object).itertuples(index=False, name=None))
+
+
+class KeyRegistry:
+    def __init__(self, path=REGISTRY_PATH):
+        self.path = path
+        self.ids = {table: {} for table in DIMENSIONS}
+        self.in_db = {table: set() for table in DIMENSIONS}
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                stored = json.load(f)
+            for table, members in stored.items():
+                if table in self.ids:
+                    self.ids[table] = {tuple(key): int(id_) for key, id_ in members}
+
+    def save(self):
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({table: [[list(key), id_] for key, id_ in ids.items()] for table, ids in self.ids.items()}, f)
+        os.replace(tmp, self.path)
+
+    def sync(self, engine):
+        """
+        Incorpora las filas que ya estan en la base de datos. Si una clave tiene otro id en la BD, o el id
+        del registro lo usa otra clave en la BD, gana la BD y la clave del registro se reasignara.
+        """
+        for table, (id_col, keys) in DIMENSIONS.items():
+            db = pd.read_sql(f"SELECT {id_col}, {', '.join(keys)} FROM {table}", con=engine)
+            db_ids = dict(zip(_key_tuples(db, keys), db[id_col].astype('int64').tolist()))
+            used = set(db_ids.values())
+            ids = self.ids[table]
+            conflicts = [k for k, v in ids.items() if db_ids.get(k, v) != v or (k not in db_ids and v in used)]
+            if conflicts:
+                print(f"[key_registry] {table}: {len(conflicts)} keys differ from the database, using the database ids")
+            for k in conflicts:
+                del ids[k]
+            ids.update(db_ids)
+            self.in_db[table] = set(db_ids)
+
+    def assign(self, table, data):
+        """
+        Devuelve (data con la columna id, filas que faltan en la BD). Las claves nuevas reciben
+        max(id) + 1, ... en orden de clave natural. Las filas con la clave incompleta se descartan.
+        """
+        id_col, keys = DIMENSIONS[table]
+        data = data.dropna(subset=keys).drop_duplicates(subset=keys)
+        ids = self.ids[table]
+        tuples = _key_tuples(data, keys)
+        new_keys = sorted(set(tuples) - set(ids))
+        next_id = max(ids.values(), default=0) + 1
+        for i, key in enumerate(new_keys):
+            ids[key] = next_id + i
+        if new_keys:
+            print(f"[key_registry] {table}: {len(new_keys)} new ids from {next_id}")
+        data = data.copy()
+        data.insert(0, id_col, [ids[k] for k in tuples])
+        missing = [k not in self.in_db[table] for k in tuples]
+        return data, data[missing]
+
+    def mark_loaded(self, table, data):
+        """Apunta como presentes en la BD las claves de `data` (despues de cargarlas)."""
+        self.in_db[table].update(_key_tuples(data, DIMENSIONS[table][1]))
+
+    def frame(self, table):
+        """Tabla id + clave natural con la misma forma que el SELECT de la dimension (para DimensionLookup)."""
+        id_col, keys = DIMENSIONS[table]
+        ids = self.ids[table]
+        frame = pd.DataFrame(list(ids), columns=keys)
+        frame.insert(0, id_col, list(ids.values()))
+        return frame.sort_values(id_col, ignore_index=True)
@@ -0,0 +1,108 @@
+"""
+load_checkpoint.py
+Checkpoint de la carga de fact_flights para poder reanudar una ejecucion interrumpida.
+Guarda en un fichero JSON los rangos de filas de hechos [start, end) ya confirmados (y los rechazados),
+si las dimensiones ya se cargaron y, en modo streaming, hasta que fila del CSV se ha cargado entera.
+Las posiciones son el numero de fila en la secuencia de hechos que genera prepare_flight_data, que es
+la misma en cada ejecucion mientras flights.csv no cambie (el fichero guarda su huella en `run_key`).
+El checkpoint se escribe justo despues de cada commit: si el proceso muere entre el commit y la
+escritura, al reanudar se repite como mucho ese lote.
+"""
+
+import json
+import os
+
+
+def _merge(ranges):
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+class LoadCheckpoint:
+    def __init__(self, path, run_key):
+        self.path = path
+        self.run_key = run_key
+        self.state = self._empty()
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                state = json.load(f)
+            if state.get('run_key') == run_key:
+                self.state = state
+                print(f"[checkpoint] resuming from {path}: {self.committed_rows} rows committed, "
+                      f"{self.rejected_rows} rejected")
+            else:
+                print(f"[checkpoint] {path} belongs to a different input, starting from zero")
+
+    def _empty(self):
+        return {'run_key': self.run_key, 'dimensions_loaded': False, 'committed': [], 'rejected': [],
+                'streamed': {'source_rows': 0, 'fact_rows': 0, 'chunksize': None}}
+
+    def save(self):
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+
+    @property
+    def dimensions_loaded(self):
+        return self.state['dimensions_loaded']
+
+    def mark_dimensions_loaded(self):
+        self.state['dimensions_loaded'] = True
+        self.save()
+
+    @property
+    def committed_rows(self):
+        return sum(end - start for start, end in self.state['committed'])
+
+    @property
+    def rejected_rows(self):
+        return sum(end - start for start, end in self.state['rejected'])
+
+    def pending(self, start, end):
+        """Subrangos de [start, end) que todavia no estan ni confirmados ni rechazados."""
+        result = []
+        pos = start
+        for lo, hi in _merge(self.state['committed'] + self.state['rejected']):
+            if hi <= pos:
+                continue
+            if lo >= end:
+                break
+            if lo > pos:
+                result.append((pos, lo))
+            pos = max(pos, hi)
+        if pos < end:
+            result.append((pos, end))
+        return result
+
+    def mark_committed(self, start, end):
+        self.state['committed'] = _merge(self.state['committed'] + [[start, end]])
+        self.save()
+
+    def mark_rejected(self, start, end):
+        self.state['rejected'] = _merge(self.state['rejected'] + [[start, end]])
+        self.save()
+
+    @property
+    def streamed(self):
+        return self.state['streamed']
+
+    def mark_streamed(self, source_rows, fact_rows, chunksize):
+        """Modo streaming: las filas del CSV hasta `source_rows` (hechos hasta `fact_rows`) estan cargadas."""
+        self.state['streamed'] = {'source_rows': source_rows, 'fact_rows': fact_rows, 'chunksize': chunksize}
+        self.save()
+
+
+def append_rejects(path, rows, row_offset, error):
+    """Anade filas rechazadas al CSV `path` con su posicion en la carga y el error de la base de datos."""
+    rejects = rows.copy()
+    rejects.insert(0, 'row_offset', range(row_offset, row_offset + len(rows)))
+    rejects['error'] = str(error)
+    rejects.to_csv(path, mode='a', index=False, header=not os.path.exists(path))
@@ -1,11 +1,29 @@
 import pandas as pd
 from sqlalchemy import create_engine
 from data_preparation import *
+import staging_cache
+import bulk_load
+import quality as qa
+import aggregates
+from routes import RouteDimension
+import change_capture
+import read_api
+from instrumentation import metrics
+from load_checkpoint import LoadCheckpoint, append_rejects
+from key_registry import DIMENSIONS, KeyRegistry, REGISTRY_PATH
+from adaptive_batch import AdaptiveBatcher, encoded_row_width, server_max_allowed_packet
 import json
-import gc
 import time
 import math
 import numpy as np
+import argparse
+import os
+import tempfile
+import threading
+import queue
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 
 
 
@@ -13,9 +31,15 @@ def load_db_config(config_file='config.json'):
     with open(config_file, 'r') as file:
         return json.load(file)
     
-def get_connection(db_config):
+def get_connection(db_config, local_infile=False):
+    connect_args = {'local_infile': True} if local_infile else {}
+    # Pool acotado: como mucho pool_size conexiones simultaneas (max_overflow=0 por defecto)
     return create_engine(
-        f'mysql+pymysql://{db_config['user']}:{db_config['password']}@{db_config['host']}:{db_config['port']}/{db_config['database']}'
+        f'mysql+pymysql://{db_config['user']}:{db_config['password']}@{db_config['host']}:{db_config['port']}/{db_config['database']}',
+        connect_args=connect_args,
+        pool_size=db_config.get('pool_size', 5),
+        max_overflow=db_config.get('max_overflow', 0),
+        pool_timeout=db_config.get('pool_timeout', 30)
     )
 
 
@@ -55,6 +79,112 @@ def load_cancellation_data(engine, cancellation_data):
         print("Cancellation dimension table loaded successfully.")
 
 
+# Clave natural de cada dimension para el modo incremental
+DIMENSION_KEYS = {table: keys for table, (_, keys) in DIMENSIONS.items()}
+
+
+def upsert_dimension(engine, data, table):
+    """
+    Inserta en `table` solo las filas de `data` cuya clave natural (DIMENSION_KEYS) aun no existe,
+    asi se puede ejecutar varias veces sin duplicar ni chocar con los UNIQUE. Devuelve las filas nuevas.
+    """
+    keys = DIMENSION_KEYS[table]
+    existing = pd.read_sql(f"SELECT {', '.join(keys)} FROM {table}", con=engine)
+    data = data.drop_duplicates(subset=keys)
+    seen = pd.MultiIndex.from_frame(existing[keys].astype(object))
+    new = data[~pd.MultiIndex.from_frame(data[keys].astype(object)).isin(seen)]
+    if len(new):
+        new.to_sql(table, con=engine, if_exists='append', index=False)
+    print(f"{table} dimension: {len(new)} new rows, {len(data) - len(new)} already present.")
+    return len(new)
+
+
+def load_dimensions_with_ids(engine, registry, dim_rows):
+    """
+    Carga las filas nuevas de cada dimension ({tabla: DataFrame}) con el id que les ha dado el
+    KeyRegistry, sin leer despues las tablas. A diferencia de load_*_data, un error se relanza:
+    los hechos ya se han preparado con esos ids.
+    """
+    for table, rows in dim_rows.items():
+        if len(rows):
+            rows.to_sql(table, con=engine, if_exists='append', index=False)
+            registry.mark_loaded(table, rows)
+        print(f"{table} dimension: {len(rows)} new rows loaded with client-side ids.")
+
+
+WATERMARK_KEY = 'fact_watermark'
+
+
+def read_watermark(engine):
+    """Ultimo dia (yyyymmdd) con hechos cargados por el modo incremental; 0 si todavia no hay ninguno."""
+    state = pd.read_sql(f"SELECT state_value FROM etl_state WHERE state_key = '{WATERMARK_KEY}'", con=engine)
+    return int(state['state_value'].iloc[0]) if len(state) else 0
+
+
+def load_flight_data_incremental(engine, flight_data, date_db, watermark, redeliver_days=(), chunksize=2000,
+                                 disable_fk=False, quality=None, table='fact_flights'):
+    """
+    Carga los hechos dia a dia, solo los dias posteriores al watermark o re-entregados (yyyymmdd).
+    Cada dia va en una transaccion: se borran los hechos que ya tuviera ese date_id, se insertan los
+    nuevos y, si el dia es posterior al watermark, se avanza el watermark de etl_state. Repetir la carga
+    no duplica nada y un fallo deja el watermark en el ultimo dia completo. Devuelve el watermark final.
+    """
+    ph = '?' if engine.dialect.paramstyle == 'qmark' else '%s'
+    key_by_id = pd.Series((date_db['year'] * 10000 + date_db['month'] * 100 + date_db['day']).to_numpy(),
+                          index=date_db['date_id'].to_numpy())
+    days = flight_data['date_id'].map(key_by_id)
+    if days.isna().any():
+        print(f"[incremental] {int(days.isna().sum())} rows without date_id skipped")
+    wanted = (days > watermark) | days.isin(list(redeliver_days))
+    missing = set(redeliver_days) - set(days[wanted].dropna().astype('int64'))
+    if missing:
+        print(f"[incremental] re-delivered days without rows in the file (left unchanged): {sorted(missing)}")
+
+    conn = engine.raw_connection()
+    cursor = conn.cursor()
+    try:
+        if disable_fk:
+            cursor.execute("SET FOREIGN_KEY_CHECKS=0;")
+            conn.commit()
+        insert_sql = _insert_sql(list(flight_data.columns), table=table, paramstyle=engine.dialect.paramstyle)
+        converter = _RowBatchConverter(flight_data.columns, chunksize)
+        for key, part in flight_data[wanted].groupby(days[wanted].astype('int64'), sort=True):
+            t0 = time.time()
+            try:
+                cursor.execute(f"DELETE FROM {table} WHERE date_id = {ph}", (int(part['date_id'].iloc[0]),))
+                replaced = cursor.rowcount
+                for start in range(0, len(part), chunksize):
+                    cursor.executemany(insert_sql, converter.convert(part.iloc[start:start + chunksize]))
+                if key > watermark:
+                    cursor.execute(f"DELETE FROM etl_state WHERE state_key = {ph}", (WATERMARK_KEY,))
+                    cursor.execute(f"INSERT INTO etl_state (state_key, state_value) VALUES ({ph}, {ph})",
+                                   (WATERMARK_KEY, str(key)))
+                    watermark = key
+                conn.commit()
+            except Exception as ex:
+                conn.rollback()
+                print(f"Error loading day {key}, watermark stays at {watermark}: {ex}")
+                raise
+            if quality is not None:
+                quality.update(part)
+                quality.note_replaced(replaced)
+            metrics.observe_batch('fact_flights_day', len(part), time.time() - t0)
+            replaced_msg = f", {replaced} previous rows replaced" if replaced and replaced > 0 else ""
+            print(f"  -> Day {key}: {len(part)} rows inserted{replaced_msg} in {time.time()-t0:.1f}s")
+
+        if disable_fk:
+            cursor.execute("SET FOREIGN_KEY_CHECKS=1;")
+            conn.commit()
+        print(f"Incremental load finished, watermark = {watermark}.")
+        return watermark
+    finally:
+        try:
+            cursor.close()
+            conn.close()
+        except Exception:
+            pass
+
+
 def load_flight_data(engine, flight_data):
     try:
         flight_data.to_sql('fact_flights', con=engine, if_exists='append', index=False, chunksize=50000, method='multi')
@@ -68,6 +198,9 @@ def _to_native_scalar(v):
    
     if pd.isna(v):
         return None
+    if isinstance(v, pd.Timedelta):
+        # columnas TIME: pymysql solo sabe escapar datetime.timedelta
+        return v.to_pytimedelta()
     if isinstance(v, (np.generic,)):
         try:
             return v.item()
@@ -75,8 +208,189 @@ def _to_native_scalar(v):
             return v
     return v
 
-def load_flight_data(engine, flight_data, chunksize=2000, disable_fk=False):
- 
+def _insert_sql(cols, table='fact_flights', paramstyle='format'):
+    # pymysql usa %s; el sustituto SQLite de benchmark.py usa ? (paramstyle 'qmark')
+    placeholders = ",".join(["?" if paramstyle == 'qmark' else "%s"] * len(cols))
+    col_list_sql = ",".join([f"`{c}`" for c in cols])
+    return f"INSERT INTO {table} ({col_list_sql}) VALUES ({placeholders})"
+
+class _RowBatchConverter:
+    """
+    Convierte un bloque del DataFrame de hechos en tuplas de valores nativos de Python para executemany,
+    columna a columna: cada columna se pasa una sola vez a un array object reutilizable (NULL -> None
+    para pd.NA/NaN/NaT) y despues se hace zip de las columnas. Los valores son los mismos que daba
+    _to_native_scalar celda a celda.
+    """
+
+    def __init__(self, columns, capacity):
+        self.columns = list(columns)
+        self.capacity = capacity
+        self.buffers = [np.empty(capacity, dtype=object) for _ in self.columns]
+
+    def _fill(self, ser, out):
+        n = len(ser)
+        dtype = ser.dtype
+        null = null_mask(ser)
+        if pd.api.types.is_timedelta64_dtype(dtype):
+            # datetime.timedelta (lo que sabe escapar pymysql); NaT -> None
+            out[:n] = ser.to_numpy().astype('timedelta64[us]')
+        elif isinstance(dtype, np.dtype) and dtype != object:
+            # numpy -> object convierte cada valor con .item() (int/float/bool de Python)
+            out[:n] = ser.to_numpy()
+        elif pd.api.types.is_extension_array_dtype(dtype) and dtype.kind in 'iufb':
+            out[:n] = ser.to_numpy(dtype=dtype.numpy_dtype, na_value=0)
+        else:
+            values = ser.to_numpy(dtype=object)
+            if pd.api.types.infer_dtype(values, skipna=True) in ('string', 'empty'):
+                out[:n] = values
+            else:
+                out[:n] = [_to_native_scalar(v) for v in values]
+        if null.any():
+            out[:n][null] = None
+
+    def convert(self, chunk):
+        n = len(chunk)
+        if n > self.capacity:
+            self.capacity = n
+            self.buffers = [np.empty(n, dtype=object) for _ in self.columns]
+        for col, buf in zip(self.columns, self.buffers):
+            self._fill(chunk[col], buf)
+        return list(zip(*(buf[:n] for buf in self.buffers)))
+
+def _iter_insert_batches(flight_data, chunksize, converter, pending=None, batcher=None):
+    """
+    Genera (i, start, end, filas) con las filas ya convertidas para executemany.
+    `pending(start, end)` devuelve los subrangos del lote que faltan por cargar (checkpoint): los rangos
+    ya cargados no se convierten y un lote a medias se genera como varios trozos.
+    Con `batcher` (adaptive_batch.AdaptiveBatcher) el tamano de cada lote se le pide a el en lugar de
+    usar chunksize.
+    """
+    total = len(flight_data)
+    i = 0
+    start = 0
+    while start < total:
+        end = min(start + (batcher.next_size() if batcher is not None else chunksize), total)
+        for lo, hi in (pending(start, end) if pending else [(start, end)]):
+            yield i, lo, hi, converter.convert(flight_data.iloc[lo:hi])
+        i += 1
+        start = end
+
+
+# Errores de conexion de MySQL (no de los datos): no tiene sentido partir el lote
+_CONNECTION_LOST_ERRORS = (2003, 2006, 2013, 2055)
+
+
+def _is_row_error(ex):
+    code = ex.args[0] if ex.args and isinstance(ex.args[0], int) else None
+    return code not in _CONNECTION_LOST_ERRORS and type(ex).__name__ != 'InterfaceError'
+
+
+def _insert_isolating(conn, cursor, insert_sql, rows, start, on_commit, on_reject):
+    """
+    Inserta un lote de 2 o mas filas que ha fallado partiendolo por la mitad recursivamente: cada mitad que entra se
+    confirma (on_commit(start, end)) y cada fila que falla sola se rechaza (on_reject(pos, error)).
+    Devuelve (filas confirmadas, filas rechazadas).
+    """
+    committed = rejected = 0
+    mid = len(rows) // 2
+    for lo, part in ((start, rows[:mid]), (start + mid, rows[mid:])):
+        try:
+            cursor.executemany(insert_sql, part)
+            conn.commit()
+            on_commit(lo, lo + len(part))
+            committed += len(part)
+        except Exception as ex:
+            conn.rollback()
+            if not _is_row_error(ex):
+                raise
+            if len(part) == 1:
+                on_reject(lo, ex)
+                rejected += 1
+            else:
+                c, r = _insert_isolating(conn, cursor, insert_sql, part, lo, on_commit, on_reject)
+                committed += c
+                rejected += r
+    return committed, rejected
+
+
+class _BatchPrefetcher:
+    """
+    Productor/consumidor: un hilo productor recorre `batches` (slicing + conversion de filas) y deja los
+    lotes en una cola acotada de `depth` elementos mientras el consumidor inserta el lote anterior.
+    Las excepciones del productor se relanzan en el consumidor. `stats` acumula el tiempo que cada lado
+    pasa esperando: producer_wait (cola llena: manda el servidor) y consumer_wait (cola vacia: manda
+    la conversion en el cliente).
+    """
+
+    _DONE = object()
+
+    def __init__(self, batches, depth):
+        self.batches = batches
+        self.queue = queue.Queue(maxsize=max(depth, 1))
+        self.stop_event = threading.Event()
+        self.stats = {'producer_wait': 0.0, 'consumer_wait': 0.0}
+        self.thread = threading.Thread(target=self._produce, name='batch-producer', daemon=True)
+
+    def _put(self, item):
+        t0 = time.perf_counter()
+        while not self.stop_event.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                break
+            except queue.Full:
+                continue
+        self.stats['producer_wait'] += time.perf_counter() - t0
+
+    def _produce(self):
+        try:
+            for item in self.batches:
+                if self.stop_event.is_set():
+                    return
+                self._put(item)
+            self._put(self._DONE)
+        except BaseException as ex:
+            self._put(ex)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __iter__(self):
+        while True:
+            t0 = time.perf_counter()
+            item = self.queue.get()
+            self.stats['consumer_wait'] += time.perf_counter() - t0
+            if item is self._DONE:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+
+    def __exit__(self, *exc):
+        self.stop_event.set()
+        self.thread.join()
+        return False
+
+
+def load_flight_data(engine, flight_data, chunksize=2000, disable_fk=False, queue_depth=0,
+                     checkpoint=None, reject_file=None, row_offset=0, commit_every=1, quality=None,
+                     target_latency=None, table='fact_flights'):
+    """
+    Inserta el DataFrame de hechos en fact_flights con executemany, un commit por lote.
+    Con queue_depth > 0 la preparacion de los lotes siguientes se hace en un hilo productor
+    (ver _BatchPrefetcher) mientras la conexion inserta el lote actual.
+    Con `checkpoint` (LoadCheckpoint) cada lote confirmado se apunta como el rango de filas
+    [row_offset + start, row_offset + end) y los rangos ya apuntados se saltan al reanudar.
+    Con `reject_file` un lote que falla por sus datos se parte hasta encontrar las filas culpables,
+    que se escriben en ese CSV; el resto del lote se confirma.
+    Con commit_every > 1 se hace un commit cada `commit_every` lotes (carga masiva); no se puede
+    combinar con reject_file, porque un error deshace tambien los lotes aun sin confirmar.
+    `quality` (quality.QualityAccumulator) recibe cada lote confirmado.
+    Con `target_latency` (segundos) no se usa chunksize: el tamano de lote lo decide un AdaptiveBatcher
+    a partir del ancho de fila y max_allowed_packet, y despues de la latencia de cada lote.
+    """
+    if commit_every > 1 and reject_file is not None:
+        raise ValueError("commit_every > 1 cannot be combined with reject_file")
     conn = engine.raw_connection()
     cursor = conn.cursor()
     try:
@@ -84,49 +398,335 @@ def load_flight_data(engine, flight_data, chunksize=2000, disable_fk=False):
             cursor.execute("SET FOREIGN_KEY_CHECKS=0;")
             conn.commit()
 
-        cols = list(flight_data.columns)
-        placeholders = ",".join(["%s"] * len(cols))
-        col_list_sql = ",".join([f"`{c}`" for c in cols])
-        insert_sql = f"INSERT INTO fact_flights ({col_list_sql}) VALUES ({placeholders})"
+        insert_sql = _insert_sql(list(flight_data.columns), table=table, paramstyle=engine.dialect.paramstyle)
+        converter = _RowBatchConverter(flight_data.columns, chunksize)
 
         total = len(flight_data)
         batches = math.ceil(total / chunksize)
         # print(f"Inserting {total} rows in {batches} batches of {chunksize}...")
+        batcher = None
+        if target_latency:
+            batcher = AdaptiveBatcher(encoded_row_width(converter.convert(flight_data.iloc[:200])),
+                                      server_max_allowed_packet(cursor, engine.dialect.name),
+                                      target_seconds=target_latency)
+        of_batches = f"/{batches}" if batcher is None else ""
+
+        def on_commit(start, end):
+            if quality is not None:
+                quality.update(flight_data.iloc[start:end])
+            if checkpoint is not None:
+                checkpoint.mark_committed(row_offset + start, row_offset + end)
+
+        def on_reject(pos, error):
+            print(f"  -> Row {row_offset + pos + 1} rejected: {error}")
+            append_rejects(reject_file, flight_data.iloc[pos:pos + 1], row_offset + pos, error)
+            if checkpoint is not None:
+                checkpoint.mark_rejected(row_offset + pos, row_offset + pos + 1)
+
+        pending = None
+        if checkpoint is not None:
+            pending = lambda start, end: [(lo - row_offset, hi - row_offset)
+                                          for lo, hi in checkpoint.pending(row_offset + start, row_offset + end)]
+            remaining = sum(hi - lo for lo, hi in pending(0, total))
+            if remaining < total:
+                print(f"[checkpoint] {total - remaining} of {total} rows already loaded, inserting {remaining}")
+
+        batch_iter = _iter_insert_batches(flight_data, chunksize, converter, pending, batcher)
+        prefetcher = _BatchPrefetcher(batch_iter, queue_depth) if queue_depth > 0 else None
+        insert_seconds = 0.0
+        rejected = 0
+        uncommitted = []
+        t_start = time.time()
+
+        with prefetcher or contextlib.nullcontext():
+            for i, start, end, to_list in (prefetcher if prefetcher else batch_iter):
+                t0 = time.time()
+                try:
+                    cursor.executemany(insert_sql, to_list)
+                    uncommitted.append((start, end))
+                    if len(uncommitted) >= commit_every:
+                        conn.commit()
+                        for lo, hi in uncommitted:
+                            on_commit(lo, hi)
+                        uncommitted.clear()
+                    metrics.observe_batch('fact_flights', end - start, time.time() - t0)
+                    if batcher is not None:
+                        batcher.record(end - start, time.time() - t0)
+                    print(f"  -> Batch {i+1}{of_batches} inserted rows {start+1}-{end} in {time.time()-t0:.1f}s")
+                except Exception as ex:
+                    conn.rollback()
+                    print(f"Error inserting batch {i+1}: {ex}")
+                    if uncommitted:
+                        print(f"  (rows {uncommitted[0][0]+1}-{uncommitted[-1][1]} were not committed yet "
+                              f"and have been rolled back too)")
+                        # no marcarlos como cargados al final (_insert_isolating confirma lo que inserta)
+                        uncommitted.clear()
+                    if reject_file is not None and _is_row_error(ex):
+                        if len(to_list) == 1:
+                            on_reject(start, ex)
+                            committed, bad = 0, 1
+                        else:
+                            committed, bad = _insert_isolating(conn, cursor, insert_sql, to_list, start,
+                                                               on_commit, on_reject)
+                        rejected += bad
+                        print(f"  -> Batch {i+1}{of_batches}: {committed} rows inserted, {bad} rejected")
+                        continue
+
+                    # print("Sample converted rows (first 5):")
+                    for r in to_list[:5]:
+                        print(r)
+                    raise
+                finally:
+                    insert_seconds += time.time() - t0
+                    # liberar memoria (sin gc.collect() forzado: las tuplas no forman ciclos)
+                    del to_list
+
+        if uncommitted:
+            conn.commit()
+            for lo, hi in uncommitted:
+                on_commit(lo, hi)
+
+        if disable_fk:
+            cursor.execute("SET FOREIGN_KEY_CHECKS=1;")
+            conn.commit()
+
+        if rejected:
+            print(f"All batches processed: {rejected} rows rejected, written to {reject_file}.")
+        else:
+            print("All batches inserted successfully.")
+        if prefetcher:
+            print(f"Pipeline stats: total {time.time()-t_start:.1f}s, insert {insert_seconds:.1f}s, "
+                  f"producer waited {prefetcher.stats['producer_wait']:.1f}s (queue full), "
+                  f"consumer waited {prefetcher.stats['consumer_wait']:.1f}s (queue empty)")
+    finally:
+        try:
+            cursor.close()
+            conn.close()
+        except Exception:
+            pass
+
+
+def _date_partitions(flight_data, partitions):
+    """
+    Divide el DataFrame de hechos en como mucho `partitions` rangos contiguos de date_id con un numero
+    de filas parecido. Las filas sin date_id van a una particion aparte.
+    Devuelve una lista de (lo, hi, DataFrame).
+    """
+    date_ids = flight_data['date_id']
+    missing = null_mask(date_ids)
+    counts = date_ids[~missing].value_counts(dropna=True).sort_index()
+    result = []
+    if len(counts) > 0:
+        target = counts.sum() / max(partitions, 1)
+        group = np.minimum((counts.cumsum().to_numpy() - 1) // max(target, 1), partitions - 1)
+        for g in np.unique(group):
+            ids = counts.index[group == g]
+            lo, hi = ids.min(), ids.max()
+            result.append((lo, hi, flight_data[(date_ids >= lo) & (date_ids <= hi)]))
+    if missing.any():
+        result.append((None, None, flight_data[missing]))
+    return result
+
+
+def _load_partition(engine, part_no, part, chunksize, disable_fk, stop_event, quality=None, table='fact_flights'):
+    """Inserta una particion en una sola transaccion con una conexion del pool."""
+    conn = engine.raw_connection()
+    cursor = conn.cursor()
+    t0 = time.time()
+    try:
+        if disable_fk:
+            cursor.execute("SET FOREIGN_KEY_CHECKS=0;")
+        insert_sql = _insert_sql(list(part.columns), table=table, paramstyle=engine.dialect.paramstyle)
+        converter = _RowBatchConverter(part.columns, chunksize)
+        total = len(part)
+        for start in range(0, total, chunksize):
+            if stop_event.is_set():
+                conn.rollback()
+                return {'partition': part_no, 'status': 'cancelled', 'rows': 0,
+                        'seconds': time.time() - t0, 'worker': threading.current_thread().name}
+            rows = converter.convert(part.iloc[start:start + chunksize])
+            t_batch = time.time()
+            cursor.executemany(insert_sql, rows)
+            metrics.observe_batch('fact_flights', len(rows), time.time() - t_batch)
+        conn.commit()
+        if quality is not None:
+            quality.update(part)
+        return {'partition': part_no, 'status': 'committed', 'rows': total,
+                'seconds': time.time() - t0, 'worker': threading.current_thread().name}
+    except Exception:
+        stop_event.set()
+        conn.rollback()
+        raise
+    finally:
+        try:
+            if disable_fk:
+                # la conexion vuelve al pool: restaurar la variable de sesion
+                cursor.execute("SET FOREIGN_KEY_CHECKS=1;")
+            cursor.close()
+            conn.close()
+        except Exception:
+            pass
+
+
+def load_flight_data_parallel(engine, flight_data, workers=4, partitions=None, chunksize=2000, disable_fk=False,
+                              quality=None, table='fact_flights'):
+    """
+    Carga fact_flights con `workers` hilos en paralelo. El DataFrame se reparte en rangos de date_id y
+    cada particion se inserta en su propia transaccion con una conexion del pool de `engine`
+    (ver pool_size en config.json). Al primer error se dejan de lanzar particiones, las que estan en
+    curso hacen rollback y se imprime que particiones quedaron confirmadas.
+    """
+    parts = _date_partitions(flight_data, partitions or workers)
+    stop_event = threading.Event()
+    results = []
+    errors = []
+    t0 = time.time()
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='loader') as pool:
+        futures = [pool.submit(_load_partition, engine, n, part, chunksize, disable_fk, stop_event, quality, table)
+                   for n, (_, _, part) in enumerate(parts)]
+        for n, future in enumerate(futures):
+            lo, hi, part = parts[n]
+            try:
+                if future.cancelled():
+                    res = {'partition': n, 'status': 'not started', 'rows': 0, 'seconds': 0.0}
+                else:
+                    res = future.result()
+            except Exception as ex:
+                for f in futures:
+                    f.cancel()
+                errors.append(ex)
+                res = {'partition': n, 'status': 'failed', 'rows': 0, 'seconds': 0.0, 'error': str(ex)}
+            res.update({'date_id_from': lo, 'date_id_to': hi, 'partition_rows': len(part)})
+            results.append(res)
+            print(f"  -> Partition {n+1}/{len(parts)} date_id {lo}-{hi} ({len(part)} rows): {res['status']}")
+
+    per_worker = {}
+    for res in results:
+        if res['status'] == 'committed':
+            w = per_worker.setdefault(res['worker'], {'rows': 0, 'seconds': 0.0})
+            w['rows'] += res['rows']
+            w['seconds'] += res['seconds']
+    for name, w in sorted(per_worker.items()):
+        print(f"  {name}: {w['rows']} rows in {w['seconds']:.1f}s ({w['rows'] / max(w['seconds'], 1e-9):.0f} rows/s)")
+
+    committed = sum(r['rows'] for r in results if r['status'] == 'committed')
+    print(f"Parallel load: {committed}/{len(flight_data)} rows committed in {time.time()-t0:.1f}s")
+    if errors:
+        pending = [r for r in results if r['status'] != 'committed']
+        print("Partitions NOT committed (reload these date_id ranges):")
+        for r in pending:
+            print(f"  partition {r['partition']+1}: date_id {r['date_id_from']}-{r['date_id_to']} -> {r['status']}")
+        raise errors[0]
+    return results
+
+
+# Errores de MySQL/pymysql cuando LOAD DATA LOCAL INFILE no esta permitido en cliente o servidor
+_LOCAL_INFILE_DISABLED_ERRORS = (1148, 2068, 3948)
+
+def _tsv_column(ser):
+    """Convierte una columna del DataFrame de hechos al texto que espera LOAD DATA (NULL -> \\N)."""
+    null = null_mask(ser)
+    if pd.api.types.is_timedelta64_dtype(ser.dtype):
+        secs = ser.dt.total_seconds().fillna(0).to_numpy(dtype='int64')
+        text = (pd.Series(secs // 3600).astype(str).str.zfill(2) + ':' +
+                pd.Series((secs % 3600) // 60).astype(str).str.zfill(2) + ':' +
+                pd.Series(secs % 60).astype(str).str.zfill(2))
+    else:
+        values = ser
+        if values.dtype == object:
+            numeric = pd.to_numeric(values, errors='coerce')
+            if numeric.isna().to_numpy().sum() == null.sum():
+                values = numeric
+        if pd.api.types.is_bool_dtype(values.dtype):
+            values = values.astype('Int8')
+        if pd.api.types.is_float_dtype(values.dtype):
+            # todas las columnas numericas de fact_flights son INT: redondeo "half away from zero" como MySQL
+            f = values.to_numpy(dtype='float64', na_value=np.nan)
+            f = np.sign(f) * np.floor(np.abs(f) + 0.5)
+            text = pd.Series(np.nan_to_num(f).astype('int64')).astype(str)
+        elif pd.api.types.is_integer_dtype(values.dtype):
+            text = pd.Series(values.to_numpy(dtype='int64', na_value=0)).astype(str)
+        else:
+            text = (pd.Series(values.to_numpy(dtype=object)).astype(str)
+                    .str.replace('\\', '\\\\', regex=False)
+                    .str.replace('\t', '\\t', regex=False)
+                    .str.replace('\n', '\\n', regex=False))
+    text = text.to_numpy(dtype=object)
+    text[null] = '\\N'
+    return pd.Series(text)
+
+
+def write_fact_tsv(flight_data, buf):
+    """
+    Serializa el DataFrame de hechos en formato TSV para LOAD DATA (tab, '\\' como escape, '\\N' = NULL).
+    `buf` puede ser cualquier objeto de texto con write() (fichero de staging o io.StringIO).
+    Devuelve el numero de filas escritas.
+    """
+    if len(flight_data) == 0:
+        return 0
+    cols = [_tsv_column(flight_data[c]) for c in flight_data.columns]
+    lines = cols[0].str.cat(cols[1:], sep='\t')
+    buf.write('\n'.join(lines.tolist()))
+    buf.write('\n')
+    return len(lines)
+
+
+def _load_data_sql(path, cols, table='fact_flights'):
+    col_list_sql = ",".join([f"`{c}`" for c in cols])
+    path_sql = path.replace('\\', '/').replace("'", "\\'")
+    return (f"LOAD DATA LOCAL INFILE '{path_sql}' INTO TABLE {table} CHARACTER SET utf8mb4 "
+            f"FIELDS TERMINATED BY '\\t' ESCAPED BY '\\\\' LINES TERMINATED BY '\\n' ({col_list_sql})")
+
+
+def load_flight_data_infile(engine, flight_data, chunksize=200000, disable_fk=False, staging_dir=None,
+                            fallback_chunksize=2000, quality=None, table='fact_flights'):
+    """
+    Carga fact_flights con LOAD DATA LOCAL INFILE: cada bloque se escribe en un fichero TSV de staging
+    y se ingiere de una vez. Si el servidor (o el cliente) no permite local infile, se vuelve al
+    camino executemany de load_flight_data para las filas que falten.
+    """
+    conn = engine.raw_connection()
+    cursor = conn.cursor()
+    fallback_start = None
+    try:
+        if disable_fk:
+            cursor.execute("SET FOREIGN_KEY_CHECKS=0;")
+            conn.commit()
+
+        cols = list(flight_data.columns)
+        total = len(flight_data)
+        batches = math.ceil(total / chunksize)
 
         for i in range(batches):
             start = i * chunksize
             end = min(start + chunksize, total)
-            chunk = flight_data.iloc[start:end]
-
-            to_list = []
-            for row in chunk.itertuples(index=False, name=None):
-                new_row = tuple(_to_native_scalar(v) for v in row)
-                to_list.append(new_row)
 
             t0 = time.time()
+            with tempfile.NamedTemporaryFile('w', suffix='.tsv', dir=staging_dir, delete=False,
+                                             encoding='utf-8', newline='') as staging:
+                write_fact_tsv(flight_data.iloc[start:end], staging)
             try:
-                cursor.executemany(insert_sql, to_list)
+                cursor.execute(_load_data_sql(staging.name, cols, table=table))
                 conn.commit()
-                print(f"  -> Batch {i+1}/{batches} inserted rows {start+1}-{end} in {time.time()-t0:.1f}s")
+                if quality is not None:
+                    quality.update(flight_data.iloc[start:end])
+                metrics.observe_batch('fact_flights_infile', end - start, time.time() - t0)
+                print(f"  -> LOAD DATA batch {i+1}/{batches} rows {start+1}-{end} in {time.time()-t0:.1f}s")
             except Exception as ex:
                 conn.rollback()
-                print(f"Error inserting batch {i+1}: {ex}")
-
-                # print("Sample converted rows (first 5):")
-                for r in to_list[:5]:
-                    print(r)
+                if getattr(ex, 'args', None) and ex.args[0] in _LOCAL_INFILE_DISABLED_ERRORS:
+                    print(f"LOCAL INFILE not allowed ({ex}); falling back to executemany.")
+                    fallback_start = start
+                    break
+                print(f"Error loading batch {i+1} with LOAD DATA: {ex}")
                 raise
             finally:
-                # liberar memoria
-                del chunk
-                del to_list
-                gc.collect()
+                os.remove(staging.name)
 
         if disable_fk:
             cursor.execute("SET FOREIGN_KEY_CHECKS=1;")
             conn.commit()
-
-        print("All batches inserted successfully.")
     finally:
         try:
             cursor.close()
@@ -134,39 +734,399 @@ def load_flight_data(engine, flight_data, chunksize=2000, disable_fk=False):
         except Exception:
             pass
 
+    if fallback_start is not None:
+        load_flight_data(engine, flight_data.iloc[fallback_start:], chunksize=fallback_chunksize,
+                         disable_fk=disable_fk, quality=quality, table=table)
+    else:
+        print("All LOAD DATA batches loaded successfully.")
+
 
-if __name__ == '__main__':
-    
-    airlines_data = pd.read_csv("Data/airlines.csv")
-    airports_data = pd.read_csv("Data/airports.csv")
-    flights_data = pd.read_csv("Data/flights.csv")
+def _flight_chunks(flights_path, chunksize, usecols=None, use_cache=False):
+    if use_cache:
+        return staging_cache.iter_source_chunks('flights', flights_path, chunksize=chunksize, columns=usecols)
+    return read_flights_csv(flights_path, chunksize=chunksize, usecols=usecols)
+
+
+def prepare_dimension_data_streaming(flights_path, chunksize, use_cache=False, full_date_range=False):
+    """Primera pasada por flights.csv leyendo solo las columnas de las dimensiones date y cancellation."""
+    collector = DimensionCollector()
+    for chunk in _flight_chunks(flights_path, chunksize, use_cache=use_cache,
+                                usecols=['YEAR', 'MONTH', 'DAY', 'DAY_OF_WEEK', 'CANCELLATION_REASON']):
+        collector.update(chunk)
+    return collector.date_data(full_range=full_date_range), collector.cancellation_data()
 
-    tmp = pd.read_csv("Data/flights.csv", nrows=0)
-    print(tmp.columns.tolist()[7], tmp.columns.tolist()[8])
+
+def load_flight_data_streaming(engine, flights_path, cancellation_db, date_db, airport_db, airline_db,
+                               chunksize=500000, load_fn=None, use_cache=False, checkpoint=None, null_summary=True,
+                               aggregate_builder=None, compact=False, route_dimension=None):
+    """
+    Lee flights.csv en bloques de `chunksize` filas; cada bloque pasa por prepare_flight_data y
+    `load_fn(engine, facts)` (por defecto load_flight_data) antes de leer el siguiente, asi la
+    memoria no depende del tamano del fichero.
+    Con `checkpoint` los bloques ya cargados enteros se saltan sin prepararlos y a load_fn se le pasa
+    `row_offset` (posicion del bloque en la secuencia de hechos) para que salte los lotes ya cargados.
+    Con `aggregate_builder` (aggregates.AggregateBuilder) cada bloque cargado se anade a los agregados.
+    Con compact=True los bloques se preparan con prepare_flight_data_compact.
+    Con `route_dimension` (routes.RouteDimension) se insertan las rutas nuevas de cada bloque y los hechos
+    llevan route_id.
+    """
+    if load_fn is None:
+        load_fn = load_flight_data
+    prepare = prepare_flight_data_compact if compact else prepare_flight_data
+    lookup = DimensionLookup(cancellation_db, date_db, airport_db, airline_db)
+    total_rows = 0
+    fact_rows = 0
+    streamed = {'source_rows': 0, 'fact_rows': 0}
+    if checkpoint is not None and checkpoint.streamed.get('chunksize') == chunksize:
+        # con otro chunksize los bloques no coinciden: se preparan todos para contar los hechos
+        streamed = checkpoint.streamed
+    chunks = _flight_chunks(flights_path, chunksize, use_cache=use_cache)
+    i = 0
+    while True:
+        with metrics.stage('read_csv:flights_chunk') as st:
+            chunk = next(chunks, None)
+            st.rows = len(chunk) if chunk is not None else 0
+        if chunk is None:
+            break
+        i += 1
+        if total_rows + len(chunk) <= streamed['source_rows']:
+            total_rows += len(chunk)
+            if total_rows == streamed['source_rows']:
+                fact_rows = streamed['fact_rows']
+            print(f"Streaming chunk {i}: already loaded (checkpoint), skipped")
+            continue
+        print(f"Streaming chunk {i}: source rows {total_rows+1}-{total_rows+len(chunk)}")
+        total_rows += len(chunk)
+        facts = metrics.call('prepare_flight_data', prepare, chunk, cancellation_db, date_db,
+                             airport_db, airline_db, lookup=lookup, null_summary=null_summary)
+        del chunk
+        if route_dimension is not None:
+            facts = metrics.call('routes:attach', route_dimension.attach, engine, facts, rows=len(facts))
+        if checkpoint is not None:
+            metrics.call('load_flight_data', load_fn, engine, facts, rows=len(facts), row_offset=fact_rows)
+            fact_rows += len(facts)
+            checkpoint.mark_streamed(total_rows, fact_rows, chunksize)
+        else:
+            metrics.call('load_flight_data', load_fn, engine, facts, rows=len(facts))
+        if aggregate_builder is not None:
+            aggregate_builder.update(facts)
+        del facts
+    print(f"Streaming load finished: {total_rows} source rows processed.")
+
+
+def _day_keys(value):
+    """'YYYY-MM-DD' o 'YYYY-MM-DD:YYYY-MM-DD' -> lista de dias yyyymmdd."""
+    first, _, last = value.partition(':')
+    try:
+        days = pd.date_range(first, last or first, freq='D')
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid day or range: {value}")
+    return [d.year * 10000 + d.month * 100 + d.day for d in days]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="ETL de flights.csv hacia flights_db")
+    parser.add_argument('--stream-chunksize', type=int, default=0,
+                        help="Filas de flights.csv por bloque en modo streaming (0 = todo en memoria)")
+    parser.add_argument('--csv-engine', choices=['c', 'pyarrow'], default='c',
+                        help="Parser de pandas para flights.csv (pyarrow solo sin --stream-chunksize)")
+    parser.add_argument('--prepare-workers', type=int, default=1,
+                        help="Procesos para prepare_flight_data (solo sin --stream-chunksize)")
+    parser.add_argument('--partition-rows', type=int, default=500000,
+                        help="Filas por particion con --prepare-workers > 1")
+    parser.add_argument('--use-cache', action='store_true',
+                        help="Leer los CSV de Data/ desde la cache Parquet de staging_cache.py (se crea si falta)")
+    parser.add_argument('--load-chunksize', type=int, default=2000,
+                        help="Filas por INSERT batch en fact_flights")
+    parser.add_argument('--batch-target', type=float, metavar='SECONDS',
+                        help="Tamano de lote adaptativo con --loader executemany: el primer lote sale de "
+                             "max_allowed_packet y el ancho de fila, y despues se ajusta para que cada INSERT "
+                             "tarde unos SECONDS (sustituye a --load-chunksize)")
+    parser.add_argument('--queue-depth', type=int, default=0,
+                        help="Lotes preparados por adelantado en un hilo productor (0 = sin pipeline)")
+    parser.add_argument('--metrics', metavar='PATH',
+                        help="Escribir metricas por etapa y por lote en PATH (JSON-lines) y un resumen al final")
+    parser.add_argument('--loader', choices=['executemany', 'infile', 'parallel'], default='executemany',
+                        help="Backend de carga de fact_flights: INSERT por lotes, LOAD DATA LOCAL INFILE "
+                             "o INSERT en paralelo por rangos de date_id")
+    parser.add_argument('--workers', type=int, default=4,
+                        help="Hilos/conexiones con --loader parallel (no mas que pool_size de config.json)")
+    parser.add_argument('--infile-chunksize', type=int, default=200000,
+                        help="Filas por fichero de staging con --loader infile")
+    parser.add_argument('--checkpoint', metavar='PATH',
+                        help="Fichero de checkpoint de la carga: si existe, se reanuda desde el primer lote "
+                             "sin confirmar (solo --loader executemany)")
+    parser.add_argument('--reject-file', metavar='PATH',
+                        help="Un lote que falla se parte hasta aislar las filas culpables, que se escriben en "
+                             "este CSV; el resto se confirma (solo --loader executemany)")
+    parser.add_argument('--flights', default="Data/flights.csv",
+                        help="Fichero de vuelos a cargar (p.ej. la entrega mensual en modo incremental)")
+    parser.add_argument('--incremental', action='store_true',
+                        help="Dimensiones por clave natural (solo claves nuevas) y hechos solo de los dias "
+                             "posteriores al watermark de etl_state o re-entregados")
+    parser.add_argument('--redeliver-days', type=_day_keys, action='extend', default=[], nargs='+',
+                        metavar='DAY[:DAY]',
+                        help="Con --incremental, dias (YYYY-MM-DD o rango YYYY-MM-DD:YYYY-MM-DD) cuyos hechos "
+                             "se reemplazan aunque esten antes del watermark")
+    parser.add_argument('--bulk', action='store_true',
+                        help="Carga masiva: quita FK e indices secundarios de fact_flights, desactiva unique/FK "
+                             "checks en la sesion, y al final valida y reconstruye todo con un solo ALTER TABLE")
+    parser.add_argument('--commit-batches', type=int, default=1,
+                        help="Lotes de INSERT por commit con --loader executemany (p.ej. 10 con --bulk)")
+    parser.add_argument('--qa-report', metavar='PATH',
+                        help="Calcular las comprobaciones de calidad de test.py lote a lote durante la carga y "
+                             "guardarlas en PATH (JSON); sustituye a show_null_summary")
+    parser.add_argument('--qa-reconcile', action='store_true',
+                        help="Con --qa-report, comparar el numero de filas de fact_flights con las cargadas")
+    parser.add_argument('--aggregates', action='store_true',
+                        help="Actualizar agg_daily_airline, agg_daily_origin y agg_monthly_route con los hechos "
+                             "cargados (solo los dias y meses de la carga)")
+    parser.add_argument('--routes', action='store_true',
+                        help="Insertar en la dimension route los pares (origen, destino) nuevos, con la distancia "
+                             "ortodromica calculada con las coordenadas de airport, y cargar route_id en los hechos")
+    parser.add_argument('--compact', action='store_true',
+                        help="Preparar los hechos como enteros numpy (horas en minutos del dia, medidas SMALLINT) "
+                             "y cargarlos en fact_flights_compact (flights_db_compact.sql)")
+    parser.add_argument('--changes-only', nargs='?', const=change_capture.INDEX_PATH, metavar='PATH',
+                        help="Guardar un hash por hecho en un indice local (por defecto "
+                             f"{change_capture.INDEX_PATH}) y, al volver a cargar dias ya cargados, insertar solo "
+                             "las filas nuevas o cambiadas (y borrar las que cambian o desaparecen)")
+    parser.add_argument('--full-date-range', action='store_true',
+                        help="La dimension date tiene todos los dias entre la primera y la ultima fecha de "
+                             "flights.csv, no solo los dias con vuelos")
+    parser.add_argument('--key-registry', nargs='?', const=REGISTRY_PATH, metavar='PATH',
+                        help="Asignar los ids de las dimensiones en el cliente con un registro persistente "
+                             f"(por defecto {REGISTRY_PATH}); sin releer las dimensiones de la BD")
+    args = parser.parse_args()
+    if (args.checkpoint or args.reject_file) and args.loader != 'executemany':
+        parser.error("--checkpoint/--reject-file require --loader executemany")
+    if args.incremental and (args.stream_chunksize > 0 or args.checkpoint or args.loader != 'executemany'):
+        parser.error("--incremental loads whole days in memory with --loader executemany "
+                     "(no --stream-chunksize/--checkpoint)")
+    if args.bulk and args.incremental:
+        parser.error("--bulk drops the date_id index that --incremental needs to replace days")
+    if args.commit_batches > 1 and args.reject_file:
+        parser.error("--commit-batches > 1 cannot be combined with --reject-file")
+    if args.batch_target is not None and (args.batch_target <= 0 or args.loader != 'executemany' or args.incremental):
+        parser.error("--batch-target needs a positive number of seconds and --loader executemany without --incremental")
+    if args.compact and args.bulk:
+        parser.error("--bulk works on the fact_flights table and cannot be combined with --compact")
+    if args.aggregates and args.reject_file:
+        parser.error("--aggregates cannot be combined with --reject-file (run python aggregates.py rebuild after the load)")
+    if args.aggregates and args.checkpoint and args.stream_chunksize > 0:
+        parser.error("--aggregates cannot be combined with --checkpoint in streaming mode "
+                     "(run python aggregates.py rebuild after the load)")
+    if args.changes_only and (args.incremental or args.stream_chunksize > 0 or args.checkpoint or args.bulk
+                              or args.aggregates):
+        parser.error("--changes-only works on the whole file in memory and cannot be combined with --incremental, "
+                     "--stream-chunksize, --checkpoint, --bulk or --aggregates")
+    if args.qa_reconcile and not args.qa_report:
+        parser.error("--qa-reconcile requires --qa-report")
+    if args.redeliver_days and not args.incremental:
+        parser.error("--redeliver-days requires --incremental")
+    return args
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    flights_path = args.flights
+    streaming = args.stream_chunksize > 0
+    if args.metrics:
+        metrics.configure(args.metrics)
+    checkpoint = None
+    if args.checkpoint:
+        run_key = {'flights': staging_cache.file_fingerprint(flights_path, with_hash=False),
+                   'use_cache': args.use_cache}
+        checkpoint = LoadCheckpoint(args.checkpoint, run_key)
 
     try:
         # Get the connection with the database
         db_config = load_db_config()
-        engine = get_connection(db_config)
+        engine = get_connection(db_config, local_infile=args.loader == 'infile')
         print(f"Connection to the {db_config['host']} for user {db_config['user']} created successfully.")
         
     except Exception as ex:
         print("Connection could not be made due to the following error: \n", ex)
 
-    load_airline_data(engine, prepare_airline_data(airlines_data))
-    load_airport_data(engine, prepare_airport_data(airports_data))
-    load_date_data(engine, prepare_date_data(flights_data))
-    load_cancellation_data(engine, prepare_cancellation_data(flights_data))
+    if args.use_cache:
+        airlines_data = metrics.call('read_csv:airlines', staging_cache.load_source, 'airlines', "Data/airlines.csv")
+        airports_data = metrics.call('read_csv:airports', staging_cache.load_source, 'airports', "Data/airports.csv")
+    else:
+        airlines_data = metrics.call('read_csv:airlines', pd.read_csv, "Data/airlines.csv")
+        airports_data = metrics.call('read_csv:airports', pd.read_csv, "Data/airports.csv")
+    if streaming:
+        date_data, cancellation_data = metrics.call('prepare_dimension_data_streaming',
+                                                    prepare_dimension_data_streaming, flights_path,
+                                                    args.stream_chunksize, use_cache=args.use_cache,
+                                                    full_date_range=args.full_date_range)
+    else:
+        if args.use_cache:
+            flights_data = metrics.call('read_csv:flights', staging_cache.load_source, 'flights', flights_path)
+        else:
+            flights_data = metrics.call('read_csv:flights', read_flights_csv, flights_path, engine=args.csv_engine)
+        if args.incremental:
+            watermark = read_watermark(engine)
+            flights_data = select_incremental_days(flights_data, watermark, args.redeliver_days)
+            print(f"[incremental] watermark {watermark}: {len(flights_data)} rows of new or re-delivered days")
+        date_data, cancellation_data = metrics.call('extract_dimension_data', extract_dimension_data, flights_data,
+                                                    full_date_range=args.full_date_range, rows=len(flights_data))
+
+    dims_loaded = None
+    if args.key_registry:
+        # ids asignados en el cliente: las dimensiones se cargan en otro hilo mientras se preparan los hechos
+        registry = KeyRegistry(args.key_registry)
+        metrics.call('key_registry:sync', registry.sync, engine)
+        dim_rows = {}
+        for table, data in (('airline', prepare_airline_data(airlines_data)),
+                            ('airport', prepare_airport_data(airports_data)),
+                            ('date', date_data), ('cancellation_reason', cancellation_data)):
+            _, dim_rows[table] = registry.assign(table, data)
+        registry.save()
+        dims_loaded = ThreadPoolExecutor(max_workers=1).submit(
+            metrics.call, 'load_dimensions_with_ids', load_dimensions_with_ids, engine, registry, dim_rows)
+        cancellation_db, date_db, airport_db, airline_db = (
+            registry.frame(t) for t in ('cancellation_reason', 'date', 'airport', 'airline'))
+    else:
+        if checkpoint is not None and checkpoint.dimensions_loaded:
+            print("[checkpoint] dimension tables already loaded, skipped")
+        elif args.incremental:
+            metrics.call('upsert_dimension:airline', upsert_dimension, engine,
+                         prepare_airline_data(airlines_data), 'airline')
+            metrics.call('upsert_dimension:airport', upsert_dimension, engine,
+                         prepare_airport_data(airports_data), 'airport')
+            metrics.call('upsert_dimension:date', upsert_dimension, engine, date_data, 'date')
+            metrics.call('upsert_dimension:cancellation_reason', upsert_dimension, engine, cancellation_data,
+                         'cancellation_reason')
+        else:
+            airline_dim = metrics.call('prepare_airline_data', prepare_airline_data, airlines_data)
+            airport_dim = metrics.call('prepare_airport_data', prepare_airport_data, airports_data)
+            metrics.call('load_airline_data', load_airline_data, engine, airline_dim, rows=len(airline_dim))
+            metrics.call('load_airport_data', load_airport_data, engine, airport_dim, rows=len(airport_dim))
+            metrics.call('load_date_data', load_date_data, engine, date_data, rows=len(date_data))
+            metrics.call('load_cancellation_data', load_cancellation_data, engine, cancellation_data,
+                         rows=len(cancellation_data))
+            if checkpoint is not None:
+                checkpoint.mark_dimensions_loaded()
+
+
 
+        # Read the dimension tables to get the IDs and add them to the fact table
+        airport_db = metrics.call('read_dimension:airport', pd.read_sql, 'SELECT airport_id, iata_code FROM airport', con=engine)
+        airline_db = metrics.call('read_dimension:airline', pd.read_sql, 'SELECT airline_id, airline_iata FROM airline', con=engine)
+        date_db = metrics.call('read_dimension:date', pd.read_sql, 'SELECT date_id, year, month, day FROM date', con=engine)
+        cancellation_db = metrics.call('read_dimension:cancellation_reason', pd.read_sql,
+                                       'SELECT cancellation_id, cancellation_type FROM cancellation_reason', con=engine)
 
+    def before_fact_load():
+        # los hechos no se insertan hasta que las dimensiones con esos ids esten confirmadas
+        read_api.bump_generation(engine)
+        if dims_loaded is not None:
+            dims_loaded.result()
+            if checkpoint is not None:
+                checkpoint.mark_dimensions_loaded()
+        if args.bulk:
+            bulk_load.ensure_month_partitions(engine)
+            bulk_load.begin_bulk_load(engine)
 
-    # Read the dimension tables to get the IDs and add them to the fact table
-    airport_db = pd.read_sql('SELECT airport_id, iata_code FROM airport', con=engine)
-    airline_db = pd.read_sql('SELECT airline_id, airline_iata FROM airline', con=engine)
-    date_db = pd.read_sql('SELECT date_id, year, month, day FROM date', con=engine)
-    cancellation_db = pd.read_sql('SELECT cancellation_id, cancellation_type FROM cancellation_reason', con=engine)
+    # estadisticas de calidad lote a lote (sustituyen a show_null_summary y a los scans de test.py)
+    quality = None
+    fact_table = COMPACT_FACT_TABLE if args.compact else 'fact_flights'
+    if args.qa_report:
+        quality = qa.QualityAccumulator({'airline_id': airline_db, 'origin_airport_id': airport_db,
+                                         'destination_airport_id': airport_db, 'date_id': date_db,
+                                         'cancellation_id': cancellation_db})
+        if args.qa_reconcile:
+            fact_rows_before = qa.table_counts(engine, ('fact_flights',))['fact_flights']
+        qa_full_load = qa.table_is_empty(engine, fact_table)
+    null_summary = quality is None
+    prepare = prepare_flight_data_compact if args.compact else prepare_flight_data
+    aggregate_builder = aggregates.AggregateBuilder(date_db, cancellation_db) if args.aggregates else None
+    route_dimension = RouteDimension(compact=args.compact) if args.routes else None
 
-    facts_flight_data = prepare_flight_data(flights_data, cancellation_db, date_db, airport_db, airline_db)
+    def attach_routes(facts):
+        # despues de before_fact_load: las rutas tienen FK a airport
+        if route_dimension is None:
+            return facts
+        return metrics.call('routes:attach', route_dimension.attach, engine, facts, rows=len(facts))
+
+    if args.loader == 'infile':
+        load_facts = partial(load_flight_data_infile, chunksize=args.infile_chunksize, disable_fk=True,
+                             fallback_chunksize=args.load_chunksize, quality=quality, table=fact_table)
+    elif args.loader == 'parallel':
+        load_facts = partial(load_flight_data_parallel, workers=args.workers, chunksize=args.load_chunksize,
+                             disable_fk=True, quality=quality, table=fact_table)
+    else:
+        load_facts = partial(load_flight_data, chunksize=args.load_chunksize, disable_fk=True,
+                             queue_depth=args.queue_depth, checkpoint=checkpoint, reject_file=args.reject_file,
+                             commit_every=args.commit_batches, quality=quality, target_latency=args.batch_target,
+                             table=fact_table)
+
+    if args.incremental:
+        if len(flights_data):
+            facts_flight_data = metrics.call('prepare_flight_data', prepare, flights_data,
+                                             cancellation_db, date_db, airport_db, airline_db,
+                                             null_summary=null_summary)
+            before_fact_load()
+            facts_flight_data = attach_routes(facts_flight_data)
+            metrics.call('load_flight_data', load_flight_data_incremental, engine, facts_flight_data, date_db,
+                         watermark, args.redeliver_days, chunksize=args.load_chunksize, disable_fk=True,
+                         quality=quality, table=fact_table, rows=len(facts_flight_data))
+            if aggregate_builder is not None:
+                aggregate_builder.update(facts_flight_data)
+        else:
+            before_fact_load()
+            print("[incremental] no new or re-delivered days, nothing to load.")
+    elif streaming:
+        before_fact_load()
+        load_flight_data_streaming(engine, flights_path, cancellation_db, date_db, airport_db, airline_db,
+                                   chunksize=args.stream_chunksize, load_fn=load_facts, use_cache=args.use_cache,
+                                   checkpoint=checkpoint, null_summary=null_summary,
+                                   aggregate_builder=aggregate_builder, compact=args.compact,
+                                   route_dimension=route_dimension)
+    else:
+        if args.prepare_workers > 1:
+            facts_flight_data = metrics.call('prepare_flight_data', prepare_flight_data_parallel, flights_data,
+                                             cancellation_db, date_db, airport_db, airline_db,
+                                             workers=args.prepare_workers, partition_rows=args.partition_rows,
+                                             by_month=True, null_summary=null_summary, compact=args.compact)
+        else:
+            facts_flight_data = metrics.call('prepare_flight_data', prepare, flights_data,
+                                             cancellation_db, date_db, airport_db, airline_db,
+                                             null_summary=null_summary)
+        before_fact_load()
+        facts_flight_data = attach_routes(facts_flight_data)
+        changes = None
+        if args.changes_only:
+            change_index = change_capture.ChangeIndex(args.changes_only, fact_table)
+            changes = metrics.call('changes:diff', change_index.diff, engine, facts_flight_data,
+                                   rows=len(facts_flight_data))
+            deleted = metrics.call('changes:delete', change_capture.apply_deletes, engine, changes, fact_table,
+                                   args.compact)
+            if quality is not None:
+                quality.note_replaced(deleted)
+            facts_flight_data = changes.facts
+        metrics.call('load_flight_data', load_facts, engine, facts_flight_data, rows=len(facts_flight_data))
+        if changes is not None:
+            change_index.commit(changes)
+        if aggregate_builder is not None:
+            aggregate_builder.update(facts_flight_data)
+
+    if args.bulk:
+        metrics.call('bulk_load:finish', bulk_load.finish_bulk_load, engine)
+
+    if aggregate_builder is not None:
+        metrics.call('aggregates:refresh', aggregates.refresh, engine, aggregate_builder)
+
+    if quality is not None:
+        reconciliation = None
+        if args.qa_reconcile:
+            reconciliation = qa.reconcile(quality.report(), fact_rows_before, qa.table_counts(engine))
+        qa.write_report(args.qa_report, quality, reconciliation, full_load=qa_full_load)
+
+    # los resultados que read_api tenga en cache dejan de valer
+    read_api.bump_generation(engine)
+    metrics.summary()
+    metrics.close()
 
     # print("facts_flight_data shape:", facts_flight_data.shape)
 
@@ -201,7 +1161,5 @@ if __name__ == '__main__':
 
     # load_flight_data(engine,facts_flight_data )
 
-    load_flight_data(engine, facts_flight_data, chunksize=2000, disable_fk=True)
-
 
 
@@ -0,0 +1,140 @@
+"""
+quality.py
+Estadisticas de calidad de fact_flights calculadas lote a lote durante la carga, con los datos que el
+loader ya tiene en memoria, en lugar de recorrer la tabla con una consulta por comprobacion despues.
+Calcula lo mismo que los apartados 4, 5, 7 y 8 de test.py (huerfanos, nulos, arrival_delay,
+distance <= 0, air_time nulo y cancelaciones) y lo guarda en un informe JSON. La reconciliacion con la
+base de datos es opcional y solo cuenta filas.
+"""
+
+import json
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from data_preparation import expand_compact_nulls
+
+# columna del hecho -> columnas (id) del DataFrame de la dimension con que se comprueban los huerfanos
+FACT_DIMENSIONS = {
+    'airline_id': 'airline_id',
+    'origin_airport_id': 'airport_id',
+    'destination_airport_id': 'airport_id',
+    'date_id': 'date_id',
+    'cancellation_id': 'cancellation_id',
+}
+
+
+class QualityAccumulator:
+    """
+    Se alimenta con update(lote) despues de cada commit (solo filas confirmadas). Es seguro entre hilos
+    (loader parallel). `dimensions` son los DataFrames de ids de las dimensiones (los mismos que usa
+    prepare_flight_data): {'airline_id': airline_db, 'origin_airport_id': airport_db, ...}.
+    """
+
+    def __init__(self, dimensions=None):
+        self.valid_ids = {}
+        for col, frame in (dimensions or {}).items():
+            self.valid_ids[col] = np.unique(frame[FACT_DIMENSIONS[col]].to_numpy(dtype='float64'))
+        self.lock = threading.Lock()
+        self.rows = 0
+        self.batches = 0
+        self.replaced_rows = 0
+        self.nulls = {}
+        self.orphans = {col: 0 for col in self.valid_ids}
+        self.delay = {'count': 0, 'sum': 0.0, 'min': None, 'max': None}
+        self.distance_le_zero = 0
+        self.cancelled_with_no_reason = 0
+        self.cancelled_with_reason = 0
+
+    def update(self, batch):
+        batch = expand_compact_nulls(batch)
+        nulls = batch.isna().sum()
+        orphans = {}
+        for col, ids in self.valid_ids.items():
+            if col in batch.columns:
+                values = batch[col].to_numpy(dtype='float64', na_value=np.nan)
+                orphans[col] = int((~np.isnan(values) & ~np.isin(values, ids)).sum())
+        delay = batch['arrival_delay'].dropna() if 'arrival_delay' in batch.columns else pd.Series(dtype='float64')
+        distance_le_zero = int((batch['distance'] <= 0).sum()) if 'distance' in batch.columns else 0
+        no_reason = with_reason = 0
+        if 'is_cancelled' in batch.columns and 'cancellation_id' in batch.columns:
+            cancelled = batch['is_cancelled'] == 1
+            reason = batch['cancellation_id']
+            no_reason = int((cancelled & (reason.isna() | (reason == 0))).sum())
+            with_reason = int((cancelled & reason.notna()).sum())
+
+        with self.lock:
+            self.rows += len(batch)
+            self.batches += 1
+            for col, n in nulls.items():
+                self.nulls[col] = self.nulls.get(col, 0) + int(n)
+            for col, n in orphans.items():
+                self.orphans[col] += n
+            if len(delay):
+                d = self.delay
+                d['count'] += len(delay)
+                d['sum'] += float(delay.sum())
+                d['min'] = float(delay.min()) if d['min'] is None else min(d['min'], float(delay.min()))
+                d['max'] = float(delay.max()) if d['max'] is None else max(d['max'], float(delay.max()))
+            self.distance_le_zero += distance_le_zero
+            self.cancelled_with_no_reason += no_reason
+            self.cancelled_with_reason += with_reason
+
+    def note_replaced(self, rows):
+        """Filas que ya estaban en la BD y se han borrado para reemplazarlas (modo incremental)."""
+        with self.lock:
+            self.replaced_rows += max(rows or 0, 0)
+
+    def report(self):
+        d = self.delay
+        return {
+            'rows_loaded': self.rows,
+            'batches': self.batches,
+            'replaced_rows': self.replaced_rows,
+            'nulls': {col: n for col, n in self.nulls.items() if n},
+            'orphans': dict(self.orphans),
+            # como los LEFT JOIN de test.py: un id nulo tampoco encuentra su dimension
+            'orphans_or_null': {col: n + self.nulls.get(col, 0) for col, n in self.orphans.items()},
+            'arrival_delay': {'min': d['min'], 'avg': d['sum'] / d['count'] if d['count'] else None,
+                              'max': d['max']},
+            'distance_le_zero': self.distance_le_zero,
+            'null_air_time': self.nulls.get('air_time', 0),
+            'cancelled_with_no_reason': self.cancelled_with_no_reason,
+            'cancelled_with_reason': self.cancelled_with_reason,
+        }
+
+
+def table_counts(engine, tables=('airline', 'airport', 'date', 'cancellation_reason', 'fact_flights')):
+    sql = ' UNION ALL '.join(f"SELECT '{t}' AS tabla, COUNT(*) AS filas FROM {t}" for t in tables)
+    counts = pd.read_sql(sql, engine)
+    return dict(zip(counts['tabla'], counts['filas'].astype('int64').tolist()))
+
+
+def table_is_empty(engine, table='fact_flights'):
+    """Sin recorrer la tabla (LIMIT 1): si esta vacia, el informe de la carga cubre toda la tabla."""
+    return pd.read_sql(f"SELECT 1 AS found FROM {table} LIMIT 1", engine).empty
+
+
+def reconcile(report, fact_rows_before, counts):
+    """Comprueba que fact_flights tenga las filas de antes + las cargadas - las reemplazadas."""
+    expected = fact_rows_before + report['rows_loaded'] - report['replaced_rows']
+    return {'table_counts': counts, 'fact_rows_before': fact_rows_before, 'fact_rows_expected': expected,
+            'fact_rows_match': counts['fact_flights'] == expected}
+
+
+def write_report(path, accumulator, reconciliation=None, full_load=False):
+    """`full_load`: la tabla de hechos estaba vacia antes de la carga y las cifras son las de toda la tabla."""
+    report = accumulator.report()
+    report['generated_at'] = time.strftime('%Y-%m-%dT%H:%M:%S')
+    report['full_load'] = bool(full_load) and report['replaced_rows'] == 0
+    if reconciliation is not None:
+        report['reconciliation'] = reconciliation
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"QA report written to {path}: {report['rows_loaded']} rows, orphans {report['orphans']}")
+    if reconciliation is not None and not reconciliation['fact_rows_match']:
+        print(f"[qa] fact_flights has {reconciliation['table_counts']['fact_flights']} rows, "
+              f"expected {reconciliation['fact_rows_expected']}")
+    return report
@@ -0,0 +1,323 @@
+"""
+read_api.py
+Lecturas de flights_db sin pd.read_sql, que trae todo el resultado al cliente antes de construir el
+DataFrame:
+- iter_frames(engine, sql): cursor de servidor sin buffer (stream_results -> SSCursor de pymysql) y
+  DataFrames de `chunksize` filas con tipos compactos segun el tipo MySQL de cada columna (TINYINT ->
+  Int8, SMALLINT -> Int16, INT -> Int32, TIME -> timedelta, DECIMAL sin decimales -> Int64...). Los
+  tipos se fijan con el primer bloque y son los mismos en todos.
+- read_frame(engine, sql): el resultado completo a traves de una cache LRU en memoria y en disco
+  (Data/.query_cache), las dos acotadas por tamano. La clave es el SQL normalizado + los parametros + la
+  BD; la cache se invalida cuando cambia la generacion de datos que el ETL escribe en etl_state
+  (bump_generation, despues de cada carga).
+Uso: python read_api.py status|clear
+"""
+
+import argparse
+import collections
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+import time
+
+import pandas as pd
+from sqlalchemy import text
+
+CACHE_DIR = os.path.join("Data", ".query_cache")
+GENERATION_KEY = 'data_generation'
+
+# type_code de cursor.description en pymysql (pymysql.constants.FIELD_TYPE) -> dtype de pandas
+_MYSQL_DTYPES = {
+    1: 'Int8',     # TINYINT / BOOL
+    2: 'Int16',    # SMALLINT
+    3: 'Int32',    # INT
+    9: 'Int32',    # MEDIUMINT
+    8: 'Int64',    # BIGINT, COUNT(*)
+    13: 'Int16',   # YEAR
+    4: 'float32',  # FLOAT
+    5: 'float64',  # DOUBLE
+    11: 'timedelta64[ns]',  # TIME
+    10: 'datetime64[ns]',   # DATE
+    7: 'datetime64[ns]',    # TIMESTAMP
+    12: 'datetime64[ns]',   # DATETIME
+}
+_MYSQL_DECIMAL = (0, 246)  # DECIMAL, NEWDECIMAL (SUM, AVG)
+
+
+def connect():
+    """Engine de config.json (el mismo que usa main.py)."""
+    from main import get_connection, load_db_config
+    return get_connection(load_db_config())
+
+
+def _column_dtypes(description, columns, rows):
+    """dtype de cada columna: del tipo MySQL si el driver lo da; si no (SQLite), del primer bloque."""
+    dtypes = {}
+    for i, col in enumerate(columns):
+        type_code = description[i][1] if description else None
+        if type_code in _MYSQL_DTYPES:
+            dtypes[col] = _MYSQL_DTYPES[type_code]
+        elif type_code in _MYSQL_DECIMAL:
+            dtypes[col] = 'Int64' if description[i][5] == 0 else 'float64'
+        elif type_code is None:
+            values = [row[i] for row in rows if row[i] is not None]
+            if values and all(isinstance(v, int) and not isinstance(v, bool) for v in values):
+                dtypes[col] = 'Int64'
+            elif values and all(isinstance(v, (int, float)) for v in values):
+                dtypes[col] = 'float64'
+            else:
+                dtypes[col] = object
+        else:
+            dtypes[col] = object
+    return dtypes
+
+
+def _convert(values, dtype):
+    if dtype is object:
+        return pd.Series(values, dtype=object)
+    if dtype.startswith('Int'):
+        return pd.Series(pd.array([None if v is None else int(v) for v in values], dtype=dtype))
+    if dtype.startswith('float'):
+        return pd.to_numeric(pd.Series(values, dtype=object), errors='coerce').astype(dtype)
+    if dtype.startswith('timedelta'):
+        return pd.Series(pd.to_timedelta(pd.Series(values, dtype=object)))
+    return pd.Series(pd.to_datetime(pd.Series(values, dtype=object)))
+
+
+def _frame(rows, columns, dtypes):
+    values = list(zip(*rows)) if rows else [()] * len(columns)
+    return pd.DataFrame({col: _convert(list(v), dtypes[col]) for col, v in zip(columns, values)})
+
+
+def iter_frames(engine, sql, params=None, chunksize=50000):
+    """
+    Genera DataFrames de como mucho `chunksize` filas leyendo con un cursor de servidor (la memoria
+    no depende del tamano del resultado). Un resultado vacio da un unico DataFrame vacio con las columnas.
+    """
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, max_row_buffer=chunksize).execute(
+            text(sql), params or {})
+        columns = list(result.keys())
+        description = result.cursor.description if result.cursor is not None else None
+        dtypes = None
+        while True:
+            rows = result.fetchmany(chunksize)
+            if not rows:
+                break
+            if dtypes is None:
+                dtypes = _column_dtypes(description, columns, rows)
+            yield _frame(rows, columns, dtypes)
+        if dtypes is None:
+            yield _frame([], columns, _column_dtypes(description, columns, []))
+
+
+def normalize_sql(sql):
+    """SQL sin espacios repetidos ni ';' final, sin tocar literales entre comillas."""
+    parts = re.split(r"('(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"|`[^`]*`)", sql.strip().rstrip(';').strip())
+    return ''.join(p if i % 2 else re.sub(r'\s+', ' ', p) for i, p in enumerate(parts))
+
+
+def current_generation(engine):
+    """Generacion de datos de etl_state ('0' si el ETL aun no la ha escrito); None si no se puede leer."""
+    try:
+        with engine.connect() as conn:
+            row = conn.execute(text("SELECT state_value FROM etl_state WHERE state_key = :key"),
+                               {'key': GENERATION_KEY}).fetchone()
+    except Exception as ex:
+        print(f"[read_api] could not read the data generation ({ex}), cache disabled")
+        return None
+    return row[0] if row is not None else '0'
+
+
+def bump_generation(engine):
+    """Marca que los datos han cambiado: las caches de read_api dejan de servir lo leido antes."""
+    generation = f"{time.time_ns():x}"
+    try:
+        with engine.begin() as conn:
+            conn.execute(text("DELETE FROM etl_state WHERE state_key = :key"), {'key': GENERATION_KEY})
+            conn.execute(text("INSERT INTO etl_state (state_key, state_value) VALUES (:key, :value)"),
+                         {'key': GENERATION_KEY, 'value': generation})
+    except Exception as ex:
+        # sin etl_state los lectores tampoco pueden leer la generacion y no usan la cache
+        print(f"[read_api] could not write the data generation ({ex})")
+        return None
+    if _default_cache is not None:
+        # que la siguiente lectura de este proceso vea su propia escritura sin esperar a generation_ttl
+        with _default_cache.lock:
+            _default_cache.checked_at = None
+    return generation
+
+
+def _frame_bytes(frame):
+    return int(frame.memory_usage(deep=True).sum())
+
+
+class QueryCache:
+    """
+    Cache LRU de resultados: en memoria hasta `memory_bytes` y en disco (un pickle por consulta en
+    cache_dir/<generacion>/) hasta `disk_bytes`; se expulsa lo usado hace mas tiempo. La generacion de la
+    BD se consulta como mucho cada `generation_ttl` segundos; al cambiar, se borra todo lo anterior.
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR, memory_bytes=256 * 1024 ** 2, disk_bytes=2 * 1024 ** 3,
+                 generation_ttl=1.0):
+        self.cache_dir = cache_dir
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self.generation_ttl = generation_ttl
+        self.memory = collections.OrderedDict()  # clave -> (DataFrame, bytes)
+        self.memory_used = 0
+        self.generation = None
+        self.checked_at = None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def key(self, engine, sql, params):
+        payload = json.dumps([engine.url.render_as_string(hide_password=True), normalize_sql(sql), params or {}],
+                             sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _generation_dir(self):
+        return os.path.join(self.cache_dir, re.sub(r'[^0-9A-Za-z_-]', '_', self.generation))
+
+    def refresh_generation(self, engine):
+        now = time.monotonic()
+        if self.checked_at is not None and now - self.checked_at < self.generation_ttl:
+            return self.generation
+        generation = current_generation(engine)
+        with self.lock:
+            self.checked_at = now
+            if generation != self.generation:
+                self.memory.clear()
+                self.memory_used = 0
+                self.generation = generation
+                if generation is not None:
+                    self._drop_other_generations()
+        return generation
+
+    def _drop_other_generations(self):
+        if not os.path.isdir(self.cache_dir):
+            return
+        keep = os.path.basename(self._generation_dir())
+        for name in os.listdir(self.cache_dir):
+            if name != keep:
+                shutil.rmtree(os.path.join(self.cache_dir, name), ignore_errors=True)
+
+    def _remember(self, key, frame):
+        size = _frame_bytes(frame)
+        if size > self.memory_bytes:
+            return
+        if key in self.memory:
+            self.memory_used -= self.memory.pop(key)[1]
+        self.memory[key] = (frame, size)
+        self.memory_used += size
+        while self.memory_used > self.memory_bytes:
+            _, (_, evicted) = self.memory.popitem(last=False)
+            self.memory_used -= evicted
+
+    def get(self, key):
+        with self.lock:
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                self.hits += 1
+                return self.memory[key][0]
+        path = os.path.join(self._generation_dir(), key + '.pkl')
+        try:
+            frame = pd.read_pickle(path)
+        except (OSError, ValueError, EOFError):
+            with self.lock:
+                self.misses += 1
+            return None
+        os.utime(path)  # el mtime hace de "ultimo uso" para la expulsion en disco
+        with self.lock:
+            self.disk_hits += 1
+            self._remember(key, frame)
+        return frame
+
+    def put(self, key, frame):
+        with self.lock:
+            self._remember(key, frame)
+        directory = self._generation_dir()
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, key + '.pkl')
+        tmp = path + '.tmp'
+        frame.to_pickle(tmp)
+        os.replace(tmp, path)
+        self._evict_disk(directory)
+
+    def _evict_disk(self, directory):
+        entries = []
+        for name in os.listdir(directory):
+            if name.endswith('.pkl'):
+                st = os.stat(os.path.join(directory, name))
+                entries.append((st.st_mtime_ns, st.st_size, name))
+        used = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if used <= self.disk_bytes:
+                break
+            os.remove(os.path.join(directory, name))
+            used -= size
+
+    def clear(self):
+        with self.lock:
+            self.memory.clear()
+            self.memory_used = 0
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def stats(self):
+        return {'memory_hits': self.hits, 'disk_hits': self.disk_hits, 'misses': self.misses,
+                'memory_entries': len(self.memory), 'memory_bytes': self.memory_used}
+
+
+_default_cache = None
+
+
+def default_cache():
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = QueryCache()
+    return _default_cache
+
+
+def read_frame(engine, sql, params=None, chunksize=50000, cache=None):
+    """
+    Resultado completo como un DataFrame (bloques de iter_frames concatenados). cache=None usa la cache
+    por defecto y cache=False lee siempre de la BD. El DataFrame de la cache es compartido: no modificarlo.
+    """
+    cache = default_cache() if cache is None else cache
+    if cache is not False and cache.refresh_generation(engine) is not None:
+        key = cache.key(engine, sql, params)
+        frame = cache.get(key)
+        if frame is None:
+            frame = read_frame(engine, sql, params, chunksize, cache=False)
+            cache.put(key, frame)
+        return frame
+    frames = list(iter_frames(engine, sql, params, chunksize))
+    return frames[0] if len(frames) == 1 else pd.concat(frames, ignore_index=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cache de consultas de read_api")
+    parser.add_argument('command', choices=['status', 'clear'])
+    args = parser.parse_args()
+    cache = default_cache()
+    if args.command == 'clear':
+        cache.clear()
+        print(f"{cache.cache_dir} cleared.")
+        return
+    generation = cache.refresh_generation(connect())
+    files = []
+    if os.path.isdir(cache.cache_dir):
+        for root, _, names in os.walk(cache.cache_dir):
+            files += [os.path.getsize(os.path.join(root, n)) for n in names if n.endswith('.pkl')]
+    print(f"data generation {generation}: {len(files)} cached results, {sum(files) / 1024 ** 2:.1f} MB "
+          f"in {cache.cache_dir}")
+
+
+if __name__ == "__main__":
+    main()
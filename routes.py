@@ -0,0 +1,185 @@
+"""
+routes.py
+Dimension route: una fila por par (origen, destino) de los hechos preparados, con la distancia
+ortodromica (haversine) calculada una sola vez por ruta a partir de latitude/longitude de airport, y
+route_id en fact_flights (main.py --routes).
+- Los pares se sacan de origin_airport_id/destination_airport_id de los hechos ya preparados (clave
+  entera origen << 32 | destino, np.unique) y solo se insertan los que no estan en la tabla.
+- reported_distance_min/max guardan el rango de DISTANCE de flights.csv de la carga que crea la ruta,
+  asi la distancia informada se compara con la calculada por ruta: python routes.py check.
+- route_id sale del AUTO_INCREMENT (se relee la tabla despues de insertar); las rutas se insertan
+  despues de confirmar airport y antes de los hechos, que tienen FK a route.
+Uso: python routes.py check [--tolerance 0.05] | backfill
+"""
+
+import argparse
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+from data_preparation import _compact_ints, _ids_series, expand_compact_nulls
+from read_api import bump_generation
+
+# DISTANCE de flights.csv esta en millas
+EARTH_RADIUS_MILES = 3958.8
+
+
+def great_circle_miles(lat1, lon1, lat2, lon2):
+    """Distancia haversine en millas entre arrays de coordenadas en grados (NaN si falta alguna)."""
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(v, dtype='float64')) for v in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_MILES * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def _route_keys(origin, destination):
+    """origen << 32 | destino como int64; -1 si falta alguno de los dos."""
+    origin = np.asarray(origin, dtype='float64')
+    destination = np.asarray(destination, dtype='float64')
+    valid = ~(np.isnan(origin) | np.isnan(destination))
+    keys = (np.nan_to_num(origin).astype('int64') << 32) | np.nan_to_num(destination).astype('int64')
+    return np.where(valid, keys, -1)
+
+
+def _fact_keys(facts):
+    ids = expand_compact_nulls(facts[['origin_airport_id', 'destination_airport_id']])
+    return _route_keys(ids['origin_airport_id'].to_numpy(dtype='float64', na_value=np.nan),
+                       ids['destination_airport_id'].to_numpy(dtype='float64', na_value=np.nan))
+
+
+class RouteDimension:
+    """
+    attach(engine, hechos) inserta las rutas nuevas de un DataFrame de prepare_flight_data (o de
+    prepare_flight_data_compact con compact=True) y devuelve los hechos con la columna route_id.
+    Las rutas de la tabla y las coordenadas de airport se leen en la primera llamada.
+    """
+
+    def __init__(self, compact=False, tolerance=0.05):
+        self.compact = compact
+        self.tolerance = tolerance
+        self.keys = None
+        self.ids = None
+        self.coords = None
+
+    def sync(self, engine):
+        self.coords = pd.read_sql('SELECT airport_id, latitude, longitude FROM airport', con=engine,
+                                  index_col='airport_id')
+        routes = pd.read_sql('SELECT route_id, origin_airport_id, destination_airport_id FROM route', con=engine)
+        keys = _route_keys(routes['origin_airport_id'], routes['destination_airport_id'])
+        order = np.argsort(keys)
+        self.keys = keys[order]
+        self.ids = routes['route_id'].to_numpy(dtype='int64')[order]
+
+    def route_data(self, keys, reported):
+        """Filas de route para las claves `keys`; `reported` tiene min/max de DISTANCE por clave."""
+        origin = keys >> 32
+        destination = keys & 0xFFFFFFFF
+        o = self.coords.reindex(origin)
+        d = self.coords.reindex(destination)
+        reported = reported.reindex(keys)
+        return pd.DataFrame({
+            'origin_airport_id': origin,
+            'destination_airport_id': destination,
+            'great_circle_distance': great_circle_miles(o['latitude'], o['longitude'], d['latitude'], d['longitude']),
+            'reported_distance_min': reported['min'].round().astype('Int64').array,
+            'reported_distance_max': reported['max'].round().astype('Int64').array,
+        })
+
+    def insert(self, engine, keys, reported):
+        routes = self.route_data(keys, reported)
+        routes.to_sql('route', con=engine, if_exists='append', index=False)
+        off = _off_routes(routes, self.tolerance)
+        print(f"[routes] {len(routes)} new routes, {len(off)} with a reported distance more than "
+              f"{self.tolerance:.0%} away from the great-circle distance")
+        self.sync(engine)
+
+    def route_ids(self, keys):
+        """route_id de cada clave con searchsorted sobre las claves ordenadas; NaN si no hay ruta."""
+        if not len(self.keys):
+            return np.full(len(keys), np.nan)
+        pos = np.minimum(np.searchsorted(self.keys, keys), len(self.keys) - 1)
+        return np.where(self.keys[pos] == keys, self.ids[pos], np.nan)
+
+    def attach(self, engine, facts):
+        if self.keys is None:
+            self.sync(engine)
+        keys = _fact_keys(facts)
+        new = np.setdiff1d(np.unique(keys[keys >= 0]), self.keys)
+        if len(new):
+            mask = np.isin(keys, new)
+            distance = expand_compact_nulls(facts[['distance']])['distance'].to_numpy(dtype='float64', na_value=np.nan)
+            reported = pd.Series(distance[mask]).groupby(keys[mask]).agg(['min', 'max'])
+            self.insert(engine, new, reported)
+        ids = self.route_ids(keys)
+        if self.compact:
+            return facts.assign(route_id=_compact_ints(ids, 'int32', 'route_id'))
+        return facts.assign(route_id=_ids_series(ids, facts.index))
+
+
+def _off_routes(routes, tolerance):
+    """Rutas cuyo rango de distancia informada se aleja mas de `tolerance` de la distancia calculada."""
+    gc = routes['great_circle_distance']
+    limit = gc * tolerance
+    return routes[((routes['reported_distance_min'] - gc).abs() > limit) |
+                  ((routes['reported_distance_max'] - gc).abs() > limit)]
+
+
+def check(engine, tolerance=0.05):
+    """Rutas con la distancia informada fuera de tolerancia, con los codigos IATA, de mayor a menor diferencia."""
+    routes = pd.read_sql("""
+        SELECT r.route_id, o.iata_code AS origin, d.iata_code AS destination, r.great_circle_distance,
+               r.reported_distance_min, r.reported_distance_max
+        FROM route r
+        JOIN airport o ON o.airport_id = r.origin_airport_id
+        JOIN airport d ON d.airport_id = r.destination_airport_id""", con=engine)
+    off = _off_routes(routes, tolerance)
+    gap = np.maximum((off['reported_distance_min'] - off['great_circle_distance']).abs(),
+                     (off['reported_distance_max'] - off['great_circle_distance']).abs())
+    return off.assign(max_gap=gap).sort_values('max_gap', ascending=False)
+
+
+def backfill(engine):
+    """Crea las rutas de los hechos ya cargados y rellena fact_flights.route_id donde es NULL (MySQL)."""
+    pairs = pd.read_sql("""
+        SELECT origin_airport_id, destination_airport_id, MIN(distance) AS min, MAX(distance) AS max
+        FROM fact_flights
+        WHERE origin_airport_id IS NOT NULL AND destination_airport_id IS NOT NULL
+        GROUP BY origin_airport_id, destination_airport_id""", con=engine)
+    routes = RouteDimension()
+    routes.sync(engine)
+    keys = _route_keys(pairs['origin_airport_id'], pairs['destination_airport_id'])
+    new = np.isin(keys, routes.keys, invert=True)
+    if new.any():
+        reported = pairs.loc[new, ['min', 'max']].set_axis(keys[new])
+        routes.insert(engine, keys[new], reported)
+    with engine.begin() as conn:
+        updated = conn.execute(text("""
+            UPDATE fact_flights f
+            JOIN route r ON r.origin_airport_id = f.origin_airport_id
+                        AND r.destination_airport_id = f.destination_airport_id
+            SET f.route_id = r.route_id
+            WHERE f.route_id IS NULL""")).rowcount
+    print(f"[routes] route_id set on {updated} fact rows")
+
+
+def main():
+    from main import get_connection, load_db_config
+
+    parser = argparse.ArgumentParser(description="Dimension route")
+    parser.add_argument('command', choices=['check', 'backfill'])
+    parser.add_argument('--tolerance', type=float, default=0.05,
+                        help="Diferencia relativa permitida entre la distancia informada y la calculada")
+    args = parser.parse_args()
+    engine = get_connection(load_db_config())
+    if args.command == 'backfill':
+        backfill(engine)
+        bump_generation(engine)
+    else:
+        off = check(engine, args.tolerance)
+        print(off.to_string(index=False) if len(off) else "All routes within tolerance.")
+        print(f"{len(off)} routes with a reported distance more than {args.tolerance:.0%} away "
+              "from the great-circle distance")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,279 @@
+"""
+staging_cache.py
+Cache de staging en Parquet para los ficheros fuente (flights.csv, airports.csv, airlines.csv).
+Cada CSV se convierte una vez a Parquet (flights particionado por YEAR/MONTH) y las ejecuciones
+siguientes leen el Parquet (memory-mapped) en lugar de parsear el texto otra vez.
+La cache se identifica por la huella del fichero fuente (tamano, mtime, sha256): si el CSV cambia,
+la cache queda obsoleta y se vuelve a leer el CSV.
+Requisitos: pandas, pyarrow
+Uso: python staging_cache.py status|rebuild|clear [flights airports airlines]
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+
+import pandas as pd
+
+from data_preparation import FLIGHTS_CSV_DTYPES, read_flights_csv
+
+CACHE_DIR = os.path.join("Data", ".staging")
+
+SOURCES = {
+    'flights': os.path.join("Data", "flights.csv"),
+    'airports': os.path.join("Data", "airports.csv"),
+    'airlines': os.path.join("Data", "airlines.csv"),
+}
+
+# flights.csv se escribe en bloques de este numero de filas (cada bloque -> un fichero por YEAR/MONTH)
+BUILD_CHUNKSIZE = 1000000
+
+
+def pyarrow_available():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def file_fingerprint(path, with_hash=True):
+    """Huella del fichero fuente: tamano, mtime y (opcionalmente) sha256 del contenido."""
+    st = os.stat(path)
+    fp = {'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+    if with_hash:
+        h = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                h.update(block)
+        fp['sha256'] = h.hexdigest()
+    return fp
+
+
+def _cache_dir(name, cache_dir=CACHE_DIR):
+    return os.path.join(cache_dir, name)
+
+
+def _manifest_path(name, cache_dir=CACHE_DIR):
+    return os.path.join(_cache_dir(name, cache_dir), 'manifest.json')
+
+
+def read_manifest(name, cache_dir=CACHE_DIR):
+    try:
+        with open(_manifest_path(name, cache_dir), 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_manifest(name, manifest, cache_dir=CACHE_DIR):
+    tmp = _manifest_path(name, cache_dir) + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, _manifest_path(name, cache_dir))
+
+
+def cache_status(name, path, cache_dir=CACHE_DIR):
+    """
+    'fresh' si la cache corresponde al fichero actual, 'stale' si el fichero ha cambiado y
+    'missing' si no hay cache (o el fichero fuente no existe).
+    Tamano y mtime iguales -> fresh sin leer el fichero; si solo cambia el mtime se compara el sha256.
+    """
+    manifest = read_manifest(name, cache_dir)
+    if manifest is None or not os.path.exists(path):
+        return 'missing'
+    cached = manifest['source']
+    current = file_fingerprint(path, with_hash=False)
+    if current['size'] != cached['size']:
+        return 'stale'
+    if current['mtime_ns'] == cached['mtime_ns']:
+        return 'fresh'
+    if file_fingerprint(path)['sha256'] == cached['sha256']:
+        # mismo contenido (p.ej. fichero copiado o "touch"): se actualiza el mtime guardado
+        manifest['source']['mtime_ns'] = current['mtime_ns']
+        _write_manifest(name, manifest, cache_dir)
+        return 'fresh'
+    return 'stale'
+
+
+def invalidate(name, cache_dir=CACHE_DIR):
+    """Borra la cache de un fichero fuente."""
+    shutil.rmtree(_cache_dir(name, cache_dir), ignore_errors=True)
+
+
+def _source_chunks(name, path, chunksize):
+    if name == 'flights':
+        return read_flights_csv(path, chunksize=chunksize)
+    return [pd.read_csv(path)]
+
+
+def build_cache(name, path, cache_dir=CACHE_DIR, chunksize=BUILD_CHUNKSIZE):
+    """
+    Convierte el CSV a Parquet. flights se escribe particionado en YEAR=<y>/MONTH=<m>/part-<n>.parquet;
+    el manifest guarda los ficheros en el orden de escritura para poder leerlos en ese mismo orden.
+    """
+    invalidate(name, cache_dir)
+    base = _cache_dir(name, cache_dir)
+    os.makedirs(base)
+    fingerprint = file_fingerprint(path)
+
+    parts = []
+    for chunk in _source_chunks(name, path, chunksize):
+        if name == 'flights':
+            groups = chunk.groupby(['YEAR', 'MONTH'], sort=False, observed=True)
+        else:
+            groups = [(None, chunk)]
+        for key, part in groups:
+            if key is None:
+                rel = f"part-{len(parts):05d}.parquet"
+                entry = {'path': rel, 'rows': len(part)}
+            else:
+                year, month = int(key[0]), int(key[1])
+                rel = os.path.join(f"YEAR={year}", f"MONTH={month}", f"part-{len(parts):05d}.parquet")
+                entry = {'path': rel, 'rows': len(part), 'year': year, 'month': month}
+            os.makedirs(os.path.dirname(os.path.join(base, rel)), exist_ok=True)
+            part.to_parquet(os.path.join(base, rel), index=False)
+            parts.append(entry)
+
+    manifest = {'source': fingerprint, 'source_path': path, 'parts': parts,
+                'rows': sum(p['rows'] for p in parts)}
+    _write_manifest(name, manifest, cache_dir)
+    print(f"[staging_cache] {name}: {manifest['rows']} rows cached in {len(parts)} parquet files")
+    return manifest
+
+
+def _restore_dtypes(name, df):
+    # las categorias pueden diferir entre ficheros y pd.concat las deja como object
+    if name == 'flights':
+        df = df.astype({c: t for c, t in FLIGHTS_CSV_DTYPES.items() if c in df.columns})
+    return df
+
+
+def iter_cached(name, cache_dir=CACHE_DIR, columns=None):
+    """Lee los ficheros Parquet de la cache uno a uno, en el orden del manifest."""
+    manifest = read_manifest(name, cache_dir)
+    base = _cache_dir(name, cache_dir)
+    for entry in manifest['parts']:
+        yield _restore_dtypes(name, pd.read_parquet(os.path.join(base, entry['path']),
+                                                    columns=columns, memory_map=True))
+
+
+def iter_cached_chunks(name, chunksize, cache_dir=CACHE_DIR, columns=None):
+    """
+    Como iter_cached pero en bloques de exactamente `chunksize` filas (el ultimo, el resto), leyendo
+    record batches de pyarrow: los mismos bloques e indice que read_csv(chunksize=...) sobre el CSV.
+    """
+    import pyarrow.parquet as pq
+
+    manifest = read_manifest(name, cache_dir)
+    base = _cache_dir(name, cache_dir)
+    pending = []
+    rows = 0
+    start = 0
+
+    def block():
+        df = _restore_dtypes(name, pd.concat(pending, ignore_index=True) if len(pending) > 1 else pending[0])
+        df.index = pd.RangeIndex(start, start + len(df))
+        # como read_csv por bloques: solo las categorias que aparecen en el bloque
+        for col in df.columns:
+            if isinstance(df[col].dtype, pd.CategoricalDtype):
+                df[col] = df[col].cat.remove_unused_categories()
+        return df
+
+    for entry in manifest['parts']:
+        parquet = pq.ParquetFile(os.path.join(base, entry['path']), memory_map=True)
+        for batch in parquet.iter_batches(batch_size=chunksize, columns=columns):
+            frame = _restore_dtypes(name, batch.to_pandas())
+            while len(frame):
+                take = frame.iloc[:chunksize - rows]
+                frame = frame.iloc[len(take):]
+                pending.append(take)
+                rows += len(take)
+                if rows == chunksize:
+                    yield block()
+                    start += rows
+                    pending, rows = [], 0
+    if rows:
+        yield block()
+
+
+def load_cached(name, cache_dir=CACHE_DIR, columns=None):
+    parts = list(iter_cached(name, cache_dir, columns))
+    if not parts:
+        return None
+    return _restore_dtypes(name, pd.concat(parts, ignore_index=True))
+
+
+def _ensure_cache(name, path, cache_dir, build):
+    """True si se puede leer de la cache (construyendola si falta y build=True)."""
+    if not pyarrow_available():
+        print("[staging_cache] pyarrow no esta instalado: se lee el CSV")
+        return False
+    status = cache_status(name, path, cache_dir)
+    if status == 'fresh':
+        return True
+    print(f"[staging_cache] cache for {name} is {status}")
+    if not build:
+        return False
+    try:
+        build_cache(name, path, cache_dir)
+    except Exception as ex:
+        print(f"[staging_cache] could not build cache for {name}: {ex}")
+        invalidate(name, cache_dir)
+        return False
+    return True
+
+
+def load_source(name, path=None, cache_dir=CACHE_DIR, columns=None, build=True):
+    """
+    Devuelve el fichero fuente como DataFrame desde la cache Parquet si esta al dia.
+    Si falta o esta obsoleta se reconstruye (build=True) o se lee directamente el CSV.
+    """
+    path = path or SOURCES[name]
+    if _ensure_cache(name, path, cache_dir, build):
+        return load_cached(name, cache_dir, columns)
+    if name == 'flights':
+        return read_flights_csv(path, usecols=columns)
+    return pd.read_csv(path, usecols=columns)
+
+
+def iter_source_chunks(name, path=None, chunksize=BUILD_CHUNKSIZE, cache_dir=CACHE_DIR, columns=None, build=True):
+    """
+    Como load_source pero por bloques (modo streaming) de `chunksize` filas, los mismos con o sin la cache.
+    """
+    path = path or SOURCES[name]
+    if _ensure_cache(name, path, cache_dir, build):
+        return iter_cached_chunks(name, chunksize, cache_dir, columns)
+    if name == 'flights':
+        return read_flights_csv(path, chunksize=chunksize, usecols=columns)
+    return pd.read_csv(path, chunksize=chunksize, usecols=columns)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cache de staging Parquet para los CSV de Data/")
+    parser.add_argument('command', choices=['status', 'rebuild', 'clear'])
+    parser.add_argument('names', nargs='*', help="flights, airports, airlines (por defecto todos)")
+    parser.add_argument('--cache-dir', default=CACHE_DIR)
+    args = parser.parse_args()
+    unknown = [n for n in args.names if n not in SOURCES]
+    if unknown:
+        parser.error(f"unknown source(s): {', '.join(unknown)}")
+    args.names = args.names or list(SOURCES)
+
+    for name in args.names:
+        path = SOURCES[name]
+        if args.command == 'status':
+            manifest = read_manifest(name, args.cache_dir)
+            rows = manifest['rows'] if manifest else 0
+            print(f"{name}: {cache_status(name, path, args.cache_dir)} ({rows} rows cached)")
+        elif args.command == 'rebuild':
+            build_cache(name, path, args.cache_dir)
+        else:
+            invalidate(name, args.cache_dir)
+            print(f"{name}: cache removed")
+
+
+if __name__ == "__main__":
+    main()